@@ -0,0 +1,325 @@
+import asyncio
+import datetime
+import functools
+import logging
+import time
+from typing import Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from yoomoney import Client
+
+from config import Config, TenantConfig, load_config
+from database import Database
+from handlers import MessageHandler
+from ledger import PaymentLedger
+from maintenance import ActivityMiddleware, Maintenance
+from monitoring import LoopMonitor, SamplingProfiler
+from payment_handlers import PaymentHandler
+from plans import PlanCatalog
+from ratelimit import RateLimiter
+from recorder import UpdateRecorder
+from tasks import TaskSupervisor
+from tracing import configure_tracing, tracer, TracingMiddleware, TracingRequestMiddleware
+
+# Период проверки истекающих подписок, сек
+EXPIRING_CHECK_INTERVAL = 300
+# Периоды задач обслуживания базы, сек
+ARCHIVE_INTERVAL = 3600
+BACKUP_CHECK_INTERVAL = 600
+VACUUM_CHECK_INTERVAL = 30
+
+
+class StartupTimerMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: замеряет время от создания приложения до первого
+    getUpdates, то есть до готовности принимать апдейты. Когда придет первый
+    апдейт, зависит от пользователей, поэтому время до его обработки
+    замеряет только bench_startup.py
+    """
+
+    def __init__(self, app: "Application"):
+        self.app = app
+
+    async def __call__(self, make_request, bot, method):
+        if self.app.ready_ms is None and isinstance(method, GetUpdates):
+            self.app.ready_ms = (time.perf_counter() - self.app.created_at) * 1000
+            budget = self.app.config.startup_budget_ms
+            if self.app.ready_ms > budget:
+                logging.warning(
+                    f"Холодный старт до приема апдейтов: {self.app.ready_ms:.0f} мс, "
+                    f"бюджет {budget:.0f} мс превышен"
+                )
+            else:
+                logging.info(f"Холодный старт до приема апдейтов: {self.app.ready_ms:.0f} мс")
+        return await make_request(bot, method)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Подставляет обработчикам компоненты арендатора, которому принадлежит бот апдейта"""
+
+    def __init__(self, app: "Application"):
+        self.app = app
+
+    async def __call__(self, handler, event, data):
+        tenant = self.app.tenant_for_bot(data["bot"])
+        data.update(tenant.handler_data)
+        return await handler(event, data)
+
+
+class Tenant:
+    def __init__(self, config: TenantConfig, app: "Application"):
+        """
+        Арендатор: свой бот, кошелек, тарифы и данные в общей базе.
+        Сессия HTTP, пул соединений с базой, лимит запросов и фоновые
+        задачи общие для всех арендаторов процесса
+
+        Args:
+            config (TenantConfig): Настройки арендатора
+            app (Application): Приложение, которому принадлежит арендатор
+        """
+        self.config = config
+        self.app = app
+        # Режимы работы (тестовый/реальный) для админов
+        self.admin_test_modes = {}
+
+    @property
+    def key(self) -> str:
+        return self.config.key
+
+    @functools.cached_property
+    def bot(self) -> Bot:
+        return Bot(token=self.config.bot_token, session=self.app.session)
+
+    @functools.cached_property
+    def yoomoney_client(self) -> Client:
+        return Client(self.config.yoomoney_token)
+
+    @functools.cached_property
+    def db(self) -> Database:
+        return self.app.db.for_tenant(self.key)
+
+    @functools.cached_property
+    def plans(self) -> PlanCatalog:
+        return PlanCatalog(self.db)
+
+    @functools.cached_property
+    def ledger(self) -> PaymentLedger:
+        return PaymentLedger(self.yoomoney_client, self.db, sync_requested=self.app.ledger_sync_requested)
+
+    @functools.cached_property
+    def message_handler(self) -> MessageHandler:
+        return MessageHandler(self.bot, self.yoomoney_client, self.plans)
+
+    @functools.cached_property
+    def payment_handler(self) -> PaymentHandler:
+        return PaymentHandler(
+            self.bot, self.yoomoney_client, self.config.wallet_number,
+            self.db, self.ledger, self.app.tasks, self.plans
+        )
+
+    @functools.cached_property
+    def handler_data(self) -> Dict:
+        """Именованные аргументы, которые получают обработчики апдейтов этого арендатора"""
+        return {
+            "config": self.config,
+            "db": self.db,
+            "plans": self.plans,
+            "yoomoney_client": self.yoomoney_client,
+            "payment_handler": self.payment_handler,
+            "message_handler": self.message_handler,
+            "admin_test_modes": self.admin_test_modes
+        }
+
+    async def startup(self) -> None:
+        """Загружает тарифы и журнал платежей арендатора"""
+        await asyncio.gather(self.plans.load(), self.ledger.load())
+
+
+class Application:
+    def __init__(self, config: Config):
+        """
+        Приложение: один процесс обслуживает всех арендаторов из конфигурации.
+        Компоненты создаются лениво при первом обращении, асинхронная
+        инициализация выполняется в startup()
+
+        Args:
+            config (Config): Настройки процесса
+        """
+        self.config = config
+        self.created_at = time.perf_counter()
+        self.startup_ms: Optional[float] = None
+        self.ready_ms: Optional[float] = None
+        self.tenants: List[Tenant] = [Tenant(tenant, self) for tenant in config.tenants]
+        self._tenants_by_bot_id: Dict[int, Tenant] = {}
+
+    @functools.cached_property
+    def session(self) -> AiohttpSession:
+        # Одна HTTP-сессия на все боты: общий пул соединений и общий лимит запросов
+        session = AiohttpSession()
+        session.middleware(RateLimiter(self.config.rate_limit))
+        # Span на каждый запрос к Telegram
+        session.middleware(TracingRequestMiddleware())
+        session.middleware(StartupTimerMiddleware(self))
+        return session
+
+    @functools.cached_property
+    def db(self) -> Database:
+        return Database(self.config.db_path)
+
+    @functools.cached_property
+    def tasks(self) -> TaskSupervisor:
+        return TaskSupervisor(max_concurrent=self.config.max_background_tasks)
+
+    @functools.cached_property
+    def ledger_sync_requested(self) -> asyncio.Event:
+        # Общее событие: «Я оплатил» у любого арендатора будит общий цикл синхронизации
+        return asyncio.Event()
+
+    @functools.cached_property
+    def maintenance(self) -> Maintenance:
+        return Maintenance(
+            self.db, [tenant.key for tenant in self.tenants],
+            backup_dir=self.config.backup_dir,
+            backup_interval=self.config.backup_interval,
+            backups_keep=self.config.backups_keep,
+            archive_after=datetime.timedelta(days=self.config.archive_after_days),
+            idle_after=self.config.vacuum_idle_seconds
+        )
+
+    @functools.cached_property
+    def loop_monitor(self) -> LoopMonitor:
+        return LoopMonitor(threshold=self.config.loop_lag_threshold)
+
+    @functools.cached_property
+    def profiler(self) -> SamplingProfiler:
+        return SamplingProfiler()
+
+    @functools.cached_property
+    def recorder(self) -> UpdateRecorder:
+        return UpdateRecorder(self.config.record_file)
+
+    @functools.cached_property
+    def dispatcher(self) -> Dispatcher:
+        # Импорт здесь: модуль с обработчиками нужен только собранному приложению
+        from bot import router
+
+        # Общие компоненты передаются обработчикам как именованные аргументы,
+        # компоненты арендатора добавляет TenantMiddleware
+        dp = Dispatcher(
+            tasks=self.tasks,
+            loop_monitor=self.loop_monitor,
+            profiler=self.profiler
+        )
+        # Трассировка: trace id на каждый апдейт
+        dp.update.outer_middleware(TracingMiddleware())
+        dp.update.outer_middleware(TenantMiddleware(self))
+        dp.update.outer_middleware(ActivityMiddleware(self.maintenance))
+        # Запись трафика для replay.py (после TenantMiddleware: нужен ключ арендатора)
+        if self.config.record_file:
+            dp.update.outer_middleware(self.recorder)
+        dp.include_router(router)
+        return dp
+
+    def tenant_for_bot(self, bot: Bot) -> Tenant:
+        """Находит арендатора по боту, получившему апдейт"""
+        if not self._tenants_by_bot_id:
+            self._tenants_by_bot_id = {tenant.bot.id: tenant for tenant in self.tenants}
+        return self._tenants_by_bot_id[bot.id]
+
+    async def startup(self) -> None:
+        """Асинхронная инициализация; независимые шаги выполняются параллельно"""
+        configure_tracing(self.config.trace_file)
+        # Схема базы нужна всем остальным шагам
+        await self.db.init()
+        await asyncio.gather(*(tenant.startup() for tenant in self.tenants))
+        # Собираем диспетчер заранее, чтобы не тратить на это первый апдейт
+        self.dispatcher
+        self.startup_ms = (time.perf_counter() - self.created_at) * 1000
+        logging.info(
+            f"Приложение инициализировано за {self.startup_ms:.0f} мс, арендаторов: {len(self.tenants)}"
+        )
+
+    def start_background_tasks(self) -> None:
+        """Запускает общие для всех арендаторов фоновые задачи"""
+        self.tasks.periodic(
+            "ledger_sync", self.sync_ledgers, self.config.ledger_sync_interval,
+            wakeup=self.ledger_sync_requested
+        )
+        self.tasks.periodic("expiring_subscriptions", self.check_expiring_subscriptions,
+                            EXPIRING_CHECK_INTERVAL)
+        # Обслуживание базы
+        self.tasks.periodic("archive_expired", self.maintenance.archive_expired, ARCHIVE_INTERVAL)
+        if self.config.backup_dir:
+            self.tasks.periodic("backup", self.maintenance.backup, BACKUP_CHECK_INTERVAL)
+        self.tasks.periodic("vacuum", self.maintenance.vacuum_if_idle, VACUUM_CHECK_INTERVAL)
+
+    async def sync_ledgers(self) -> None:
+        """
+        Один цикл сверки платежей: синхронизирует журналы всех арендаторов
+        и зачисляет оплаты, которые не дождалась проверка счета
+        """
+        results = await asyncio.gather(
+            *(tenant.ledger.sync() for tenant in self.tenants), return_exceptions=True
+        )
+        errors = [(tenant, result) for tenant, result in zip(self.tenants, results)
+                  if isinstance(result, Exception)]
+        for tenant, error in errors:
+            logging.error(f"Ошибка при синхронизации журнала платежей арендатора {tenant.key}: {error}")
+        for tenant, result in zip(self.tenants, results):
+            if isinstance(result, Exception):
+                continue
+            try:
+                await tenant.payment_handler.reconcile_payments()
+            except Exception as e:
+                logging.error(f"Ошибка при сверке платежей арендатора {tenant.key}: {e}")
+        # Если не удалось ни у кого, отдаем ошибку супервизору, чтобы он увеличил паузу
+        if errors and len(errors) == len(self.tenants):
+            raise errors[0][1]
+
+    async def check_expiring_subscriptions(self) -> None:
+        """Проверяет истекающие подписки у всех арендаторов"""
+        for tenant in self.tenants:
+            try:
+                await tenant.payment_handler.check_expiring_subscriptions()
+            except Exception as e:
+                logging.error(f"Ошибка при проверке окончания подписок арендатора {tenant.key}: {e}")
+
+    async def shutdown(self) -> None:
+        """Останавливает фоновые задачи и закрывает соединения"""
+        await self.tasks.shutdown()
+        await self.db.close()
+        await self.loop_monitor.stop()
+        await self.session.close()
+        tracer.flush()
+        await asyncio.to_thread(tracer.close)
+        if self.config.record_file:
+            self.recorder.flush()
+
+    async def run(self) -> None:
+        """Инициализирует приложение и запускает polling всех ботов"""
+        try:
+            # Запускаем мониторинг event loop, инициализацию и фоновые задачи
+            self.loop_monitor.start()
+            await self.startup()
+            self.start_background_tasks()
+
+            # Запускаем ботов
+            await self.dispatcher.start_polling(*(tenant.bot for tenant in self.tenants))
+        except Exception as e:
+            logging.error(f"Ошибка при запуске бота: {e}")
+        finally:
+            await self.shutdown()
+
+
+def create_app(config: Optional[Config] = None) -> Application:
+    """
+    Создает приложение без побочных эффектов: ни сеть, ни база данных
+    не трогаются до вызова startup()
+
+    Args:
+        config (Config): Настройки; по умолчанию читаются из .env
+    """
+    return Application(config or load_config())
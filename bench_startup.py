@@ -0,0 +1,94 @@
+"""
+Замер холодного старта: от запуска процесса до обработки первого апдейта
+
+Собирает приложение через create_app с временной базой и сессией бота,
+которая не ходит в сеть, пропускает через диспетчер один апдейт и сравнивает
+общее время с бюджетом STARTUP_BUDGET_MS. Код возврата 1 — бюджет превышен.
+
+    python bench_startup.py
+"""
+import time
+
+_PROCESS_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+from app import create_app
+from config import Config, TenantConfig, DEFAULT_TENANT
+
+_IMPORTS_DONE = time.perf_counter()
+
+
+class _OfflineSession(BaseSession):
+    """Сессия бота без сети: на любой запрос отвечает True"""
+
+    async def make_request(self, bot, method, timeout=None):
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# Нажатие кнопки админ-панели не-админом: обработчик отвечает одним answerCallbackQuery
+_FIRST_UPDATE = {
+    "update_id": 1,
+    "callback_query": {
+        "id": "1",
+        "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+        "chat_instance": "1",
+        "data": "admin_panel"
+    }
+}
+
+
+async def bench(db_path: str, budget_ms: float) -> float:
+    """
+    Замеряет холодный старт и печатает разбивку по этапам
+
+    Args:
+        db_path (str): Временная база
+        budget_ms (float): Бюджет холодного старта, мс
+
+    Returns:
+        float: Время от запуска процесса до обработки первого апдейта, мс
+    """
+    config = Config(
+        tenants=[TenantConfig(DEFAULT_TENANT, "123456:BENCH", "bench", "0")],
+        db_path=db_path,
+        startup_budget_ms=budget_ms
+    )
+    app = create_app(config)
+    tenant = app.tenants[0]
+    tenant.bot = Bot(token=tenant.config.bot_token, session=_OfflineSession())
+
+    await app.startup()
+    startup_done = time.perf_counter()
+    await app.dispatcher.feed_update(tenant.bot, Update.model_validate(_FIRST_UPDATE))
+    first_update_done = time.perf_counter()
+    await app.shutdown()
+
+    total_ms = (first_update_done - _PROCESS_STARTED) * 1000
+    print(f"Импорт модулей:      {(_IMPORTS_DONE - _PROCESS_STARTED) * 1000:8.1f} мс")
+    print(f"Инициализация:       {(startup_done - _IMPORTS_DONE) * 1000:8.1f} мс")
+    print(f"Первый апдейт:       {(first_update_done - startup_done) * 1000:8.1f} мс")
+    print(f"Итого:               {total_ms:8.1f} мс (бюджет {config.startup_budget_ms:.0f} мс)")
+    return total_ms
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    budget_ms = float(os.getenv("STARTUP_BUDGET_MS", "3000"))
+    with tempfile.TemporaryDirectory() as tmp:
+        total_ms = asyncio.run(bench(os.path.join(tmp, "bench.db"), budget_ms))
+    sys.exit(0 if total_ms <= budget_ms else 1)
@@ -1,94 +1,53 @@
 import asyncio
+import datetime
 import logging
-from aiogram import Bot, Dispatcher, types
+import re
+from aiogram import Bot, Router, types
 from aiogram.filters import Command
-from aiogram.types import Message
-from dotenv import load_dotenv
-import os
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, BufferedInputFile
 from yoomoney import Client
 
-from keyboards import get_main_keyboard, get_subscription_keyboard, get_admin_keyboard
+from config import TenantConfig
+from keyboards import get_main_keyboard, get_admin_keyboard, get_plans_settings_keyboard
 from payment_handlers import PaymentHandler
 from handlers import MessageHandler
 from database import Database
+from plans import PlanCatalog
+from monitoring import LoopMonitor, SamplingProfiler
+from tasks import TaskSupervisor
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
-
-# Загрузка переменных окружения
-env_path = os.path.join(os.path.dirname(__file__), '.env')
-logging.info(f"Путь к файлу .env: {env_path}")
-logging.info(f"Файл .env существует: {os.path.exists(env_path)}")
-
-# Читаем и выводим содержимое файла .env (без значений)
-try:
-    with open(env_path, 'r', encoding='utf-8') as f:
-        env_content = f.read()
-        logging.info("Содержимое файла .env (только имена переменных):")
-        for line in env_content.splitlines():
-            if line.strip() and not line.strip().startswith('#'):
-                var_name = line.split('=')[0].strip()
-                logging.info(f"- {var_name}")
-except Exception as e:
-    logging.error(f"Ошибка при чтении файла .env: {e}")
-
-load_dotenv(env_path)
-
-# Получение токенов из переменных окружения
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-YOOMONEY_TOKEN = os.getenv('YOOMONEY_ACCESS_TOKEN')
-WALLET_NUMBER = os.getenv('YOOMONEY_RECEIVER')
-ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '').split(',')))  # Список ID администраторов
-
-# Отладочная информация
-logging.info(f"BOT_TOKEN найден: {'Да' if BOT_TOKEN else 'Нет'}")
-logging.info(f"YOOMONEY_TOKEN найден: {'Да' if YOOMONEY_TOKEN else 'Нет'}")
-logging.info(f"WALLET_NUMBER найден: {'Да' if WALLET_NUMBER else 'Нет'}")
-
-# Проверка наличия необходимых токенов
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в переменных окружения")
-if not YOOMONEY_TOKEN:
-    raise ValueError("YOOMONEY_TOKEN не найден в переменных окружения")
-if not WALLET_NUMBER:
-    raise ValueError("YOOMONEY_RECEIVER не найден в переменных окружения")
-
-# Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
-
-# Инициализация клиента ЮMoney
-yoomoney_client = Client(YOOMONEY_TOKEN)  # Убираем параметр token=
-
-# Инициализация базы данных
-db = Database()  # Создаст файл bot_database.db в текущей директории
-
-# Словарь для хранения режимов работы для админов
-admin_test_modes = {}
-
-# Инициализация обработчиков
-message_handler = MessageHandler(bot, yoomoney_client)
-payment_handler = PaymentHandler(bot, yoomoney_client, WALLET_NUMBER, db)
-
-# Функция проверки на админа
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+# Обработчики регистрируются на роутере; зависимости (config, db, payment_handler и т.д.)
+# передает диспетчер, собранный в app.create_app
+router = Router()
+
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+
+# label тарифа хранится у пользователя и попадает в статистику, поэтому без пробелов
+PLAN_LABEL_RE = re.compile(r"^\w+$")
+
+# Состояние редактирования тарифа в админ-панели
+class PlanEdit(StatesGroup):
+    waiting_values = State()
 
 # Регистрация обработчиков
-@dp.message(Command("start"))
-async def cmd_start(message: Message):
+@router.message(Command("start"))
+async def cmd_start(message: Message, config: TenantConfig):
     """Обработчик команды /start"""
-    is_user_admin = is_admin(message.from_user.id)
+    is_user_admin = config.is_admin(message.from_user.id)
     await message.answer(
         "👋 Добро пожаловать!\n"
         "Выберите действие:",
         reply_markup=get_main_keyboard(is_user_admin)
     )
 
-@dp.callback_query(lambda c: c.data == "admin_panel")
-async def process_admin_panel(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "admin_panel")
+async def process_admin_panel(callback_query: types.CallbackQuery, config: TenantConfig,
+                              admin_test_modes: dict):
     """Обработчик входа в админ-панель"""
-    if not is_admin(callback_query.from_user.id):
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к админ-панели.", show_alert=True)
         return
     
@@ -101,20 +60,21 @@ async def process_admin_panel(callback_query: types.CallbackQuery):
         reply_markup=get_admin_keyboard(is_test_mode)
     )
 
-@dp.callback_query(lambda c: c.data == "back_to_main")
-async def process_back_to_main(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "back_to_main")
+async def process_back_to_main(callback_query: types.CallbackQuery, config: TenantConfig):
     """Обработчик возврата в главное меню"""
-    is_user_admin = is_admin(callback_query.from_user.id)
+    is_user_admin = config.is_admin(callback_query.from_user.id)
     await callback_query.message.edit_text(
         "👋 Главное меню\n"
         "Выберите действие:",
         reply_markup=get_main_keyboard(is_user_admin)
     )
 
-@dp.callback_query(lambda c: c.data == "admin_test_mode")
-async def process_admin_test_mode(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "admin_test_mode")
+async def process_admin_test_mode(callback_query: types.CallbackQuery, config: TenantConfig,
+                                  admin_test_modes: dict):
     """Обработчик переключения тестового режима"""
-    if not is_admin(callback_query.from_user.id):
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
         return
     
@@ -130,30 +90,48 @@ async def process_admin_test_mode(callback_query: types.CallbackQuery):
     )
 
 # Добавляем заглушки для новых функций админ-панели
-@dp.callback_query(lambda c: c.data == "admin_stats")
-async def process_admin_stats(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "admin_stats")
+async def process_admin_stats(callback_query: types.CallbackQuery, config: TenantConfig,
+                              admin_test_modes: dict, db: Database, tasks: TaskSupervisor):
     """Обработчик просмотра статистики"""
-    if not is_admin(callback_query.from_user.id):
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
         return
     
-    # TODO: Добавить реальную статистику
-    await callback_query.answer("📊 Функция статистики в разработке", show_alert=True)
+    try:
+        # Статистика считается по локальному журналу платежей
+        total = await db.get_payment_stats()
+        day = await db.get_payment_stats(since=datetime.datetime.utcnow() - datetime.timedelta(days=1))
+        task_stats = tasks.stats()
+        await callback_query.message.edit_text(
+            f"📊 Статистика платежей\n"
+            f"За 24 часа: {day['count']} на сумму {day['total']:.2f}₽\n"
+            f"Всего: {total['count']} на сумму {total['total']:.2f}₽\n\n"
+            f"⚙️ Фоновые задачи: {task_stats['running']} (лимит {task_stats['limit']}, в очереди {task_stats['waiting']})\n"
+            f"Самая долгая проверка оплаты: {task_stats['oldest_age']:.0f} с\n\n"
+            "👨‍💼 Панель администратора\n"
+            "Выберите действие:",
+            reply_markup=get_admin_keyboard(admin_test_modes.get(callback_query.from_user.id, False))
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при получении статистики: {e}")
+        await callback_query.answer("❌ Ошибка при получении статистики", show_alert=True)
 
-@dp.callback_query(lambda c: c.data == "admin_users")
-async def process_admin_users(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "admin_users")
+async def process_admin_users(callback_query: types.CallbackQuery, config: TenantConfig):
     """Обработчик просмотра пользователей"""
-    if not is_admin(callback_query.from_user.id):
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
         return
     
     # TODO: Добавить список пользователей
     await callback_query.answer("👥 Функция просмотра пользователей в разработке", show_alert=True)
 
-@dp.callback_query(lambda c: c.data == "admin_balance")
-async def process_admin_balance(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "admin_balance")
+async def process_admin_balance(callback_query: types.CallbackQuery, config: TenantConfig,
+                                admin_test_modes: dict, yoomoney_client: Client):
     """Обработчик просмотра баланса"""
-    if not is_admin(callback_query.from_user.id):
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
         return
     
@@ -169,58 +147,182 @@ async def process_admin_balance(callback_query: types.CallbackQuery):
         logging.error(f"Ошибка при получении баланса: {e}")
         await callback_query.answer("❌ Ошибка при получении баланса", show_alert=True)
 
-@dp.callback_query(lambda c: c.data == "admin_settings")
-async def process_admin_settings(callback_query: types.CallbackQuery):
-    """Обработчик настроек"""
-    if not is_admin(callback_query.from_user.id):
+@router.callback_query(lambda c: c.data == "admin_settings")
+async def process_admin_settings(callback_query: types.CallbackQuery, config: TenantConfig,
+                                 plans: PlanCatalog):
+    """Обработчик настроек: список тарифов"""
+    if not config.is_admin(callback_query.from_user.id):
+        await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
+        return
+    
+    await callback_query.message.edit_text(
+        format_plans_settings(plans),
+        reply_markup=get_plans_settings_keyboard(list(plans.plans.values()))
+    )
+
+def format_plans_settings(plans: PlanCatalog) -> str:
+    """Текст со списком тарифов для админ-панели"""
+    lines = ["⚙️ Тарифы", ""]
+    for plan in plans.plans.values():
+        lines.append(f"🔹 {plan['name']}: {plan['amount']}₽, {plan['duration'].days} дн., "
+                     f"кнопка «{plan['title']}», статус {plan['label']}")
+    lines.append("")
+    lines.append("Выберите тариф для изменения:")
+    return "\n".join(lines)
+
+@router.callback_query(lambda c: c.data.startswith("admin_plan_"))
+async def process_admin_plan(callback_query: types.CallbackQuery, state: FSMContext,
+                             config: TenantConfig, plans: PlanCatalog):
+    """Обработчик выбора тарифа для изменения"""
+    if not config.is_admin(callback_query.from_user.id):
+        await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
+        return
+    
+    plan_id = callback_query.data.replace("admin_plan_", "", 1)
+    plan = plans.get(plan_id)
+    if not plan:
+        await callback_query.answer("❌ Тариф не найден", show_alert=True)
+        return
+    
+    await state.set_state(PlanEdit.waiting_values)
+    await state.update_data(plan_id=plan_id)
+    await callback_query.message.answer(
+        f"✏️ {plan['name']}: {plan['amount']}₽, {plan['duration'].days} дн., "
+        f"кнопка «{plan['title']}», статус {plan['label']}\n\n"
+        "Отправьте новые значения через «;»:\n"
+        "<цена>; <срок в днях>; [кнопка]; [название]; [статус]\n"
+        "Пустые и пропущенные поля не меняются.\n"
+        "Например: 90; 1; День; Подписка на день; basic_user\n\n"
+        "Для отмены отправьте /cancel"
+    )
+
+@router.message(PlanEdit.waiting_values)
+async def process_plan_values(message: Message, state: FSMContext, config: TenantConfig,
+                              plans: PlanCatalog):
+    """Обработчик новых значений тарифа"""
+    if not config.is_admin(message.from_user.id):
+        await state.clear()
+        return
+    
+    if message.text == "/cancel":
+        await state.clear()
+        await message.answer("❌ Изменение тарифа отменено.")
+        return
+    
+    parts = [part.strip() for part in (message.text or "").split(";")]
+    parts += [""] * (5 - len(parts))
+    title, name, label = (part or None for part in parts[2:5])
+    try:
+        amount = int(parts[0])
+        days = int(parts[1])
+        if amount <= 0 or days <= 0 or len(parts) > 5:
+            raise ValueError
+        if label and not PLAN_LABEL_RE.match(label):
+            raise ValueError
+    except ValueError:
+        await message.answer("❌ Неверный формат. Пример: 90; 1; День; Подписка на день; basic_user")
+        return
+    
+    data = await state.get_data()
+    await state.clear()
+    try:
+        await plans.update_plan(data["plan_id"], amount, datetime.timedelta(days=days),
+                                name=name, title=title, label=label)
+    except Exception as e:
+        logging.error(f"Ошибка при изменении тарифа: {e}")
+        await message.answer("❌ Ошибка при изменении тарифа")
+        return
+    
+    await message.answer(
+        "✅ Тариф обновлен.\n\n" + format_plans_settings(plans),
+        reply_markup=get_plans_settings_keyboard(list(plans.plans.values()))
+    )
+
+async def run_profiler(bot: Bot, chat_id: int, seconds: int, profiler: SamplingProfiler,
+                       loop_monitor: LoopMonitor):
+    """Профилирует event loop и отправляет отчет файлом"""
+    await bot.send_message(chat_id, f"🔬 Профилирование запущено на {seconds} с")
+    report = await profiler.profile(seconds)
+    await bot.send_document(
+        chat_id,
+        BufferedInputFile(report.encode("utf-8"), filename="profile.txt"),
+        caption=f"🔬 Профиль event loop за {seconds} с\n"
+                f"Максимальная задержка loop: {loop_monitor.max_lag * 1000:.0f} мс"
+    )
+
+@router.callback_query(lambda c: c.data == "admin_profile")
+async def process_admin_profile(callback_query: types.CallbackQuery, bot: Bot, config: TenantConfig,
+                                profiler: SamplingProfiler, loop_monitor: LoopMonitor):
+    """Обработчик запуска профилировщика из админ-панели"""
+    if not config.is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔ У вас нет доступа к этой функции.", show_alert=True)
         return
     
-    # TODO: Добавить настройки
-    await callback_query.answer("⚙️ Функция настроек в разработке", show_alert=True)
+    if profiler.running:
+        await callback_query.answer("⏳ Профилирование уже выполняется", show_alert=True)
+        return
+    
+    await callback_query.answer()
+    await run_profiler(bot, callback_query.from_user.id, PROFILE_DEFAULT_SECONDS, profiler, loop_monitor)
 
-@dp.callback_query(lambda c: c.data == "subscribe")
-async def process_subscribe_button(callback_query: types.CallbackQuery):
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, bot: Bot, config: TenantConfig, profiler: SamplingProfiler,
+                      loop_monitor: LoopMonitor):
+    """Обработчик команды /profile [секунды]"""
+    if not config.is_admin(message.from_user.id):
+        return
+    
+    if profiler.running:
+        await message.answer("⏳ Профилирование уже выполняется")
+        return
+    
+    args = message.text.split()
+    try:
+        seconds = int(args[1]) if len(args) > 1 else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await message.answer("Использование: /profile [секунды]")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    await run_profiler(bot, message.chat.id, seconds, profiler, loop_monitor)
+
+@router.callback_query(lambda c: c.data == "subscribe")
+async def process_subscribe_button(callback_query: types.CallbackQuery,
+                                   message_handler: MessageHandler):
     await message_handler.process_subscribe_button(callback_query)
 
-@dp.callback_query(lambda c: c.data.startswith("sub_"))
-async def process_subscription_choice(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data.startswith("sub_"))
+async def process_subscription_choice(callback_query: types.CallbackQuery, config: TenantConfig,
+                                      admin_test_modes: dict, payment_handler: PaymentHandler):
     # Проверяем, является ли пользователь админом и включен ли для него тестовый режим
-    is_test_mode = is_admin(callback_query.from_user.id) and admin_test_modes.get(callback_query.from_user.id, False)
+    is_test_mode = config.is_admin(callback_query.from_user.id) and admin_test_modes.get(callback_query.from_user.id, False)
     await payment_handler.process_subscription_choice(callback_query, test_mode=is_test_mode)
 
-@dp.callback_query(lambda c: c.data.startswith("extend_"))
-async def process_extend_subscription(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data.startswith("extend_"))
+async def process_extend_subscription(callback_query: types.CallbackQuery,
+                                      payment_handler: PaymentHandler):
     """Обработчик продления подписки"""
     await payment_handler.process_extend_subscription(callback_query)
 
-@dp.callback_query(lambda c: c.data == "cancel_extend")
-async def process_cancel_extend(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "cancel_extend")
+async def process_cancel_extend(callback_query: types.CallbackQuery, payment_handler: PaymentHandler):
     """Обработчик отмены продления подписки"""
     await payment_handler.process_cancel_extend(callback_query)
 
-@dp.callback_query(lambda c: c.data == "cancel_payment")
-async def cancel_payment(callback_query: types.CallbackQuery):
+@router.callback_query(lambda c: c.data == "cancel_payment")
+async def cancel_payment(callback_query: types.CallbackQuery, message_handler: MessageHandler):
     await message_handler.cancel_payment(callback_query)
 
-@dp.message(Command("balance"))
-async def cmd_balance(message: Message):
+@router.message(Command("balance"))
+async def cmd_balance(message: Message, message_handler: MessageHandler):
     await message_handler.cmd_balance(message)
 
 # Функция запуска бота
 async def main():
-    try:
-        # Запускаем фоновые задачи
-        await payment_handler.start_background_tasks()
-        
-        # Запускаем бота
-        await dp.start_polling(bot)
-    except Exception as e:
-        logging.error(f"Ошибка при запуске бота: {e}")
-    finally:
-        # Останавливаем фоновые задачи при завершении работы
-        await payment_handler.stop_background_tasks()
-        await bot.session.close()
+    from app import create_app
+
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO)
+    await create_app().run()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
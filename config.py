@@ -0,0 +1,160 @@
+import json
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# Файл .env рядом с ботом
+ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+
+# Арендатор бота из одиночной конфигурации (.env) и данных до появления арендаторов
+DEFAULT_TENANT = "default"
+
+
+class TenantConfig:
+    def __init__(self, key: str, bot_token: str, yoomoney_token: str, wallet_number: str,
+                 admin_ids: Optional[List[int]] = None):
+        """
+        Настройки одного арендатора: бот и кошелек ЮMoney
+
+        Args:
+            key (str): Ключ арендатора, которым помечаются его данные в базе
+            bot_token (str): Токен Telegram-бота
+            yoomoney_token (str): Токен доступа ЮMoney
+            wallet_number (str): Кошелек-получатель ЮMoney
+            admin_ids (List[int]): ID администраторов
+        """
+        self.key = key
+        self.bot_token = bot_token
+        self.yoomoney_token = yoomoney_token
+        self.wallet_number = wallet_number
+        self.admin_ids = set(admin_ids or [])
+
+    def is_admin(self, user_id: int) -> bool:
+        """Проверяет, является ли пользователь администратором"""
+        return user_id in self.admin_ids
+
+
+class Config:
+    def __init__(self, tenants: List[TenantConfig], db_path: str = "bot_database.db",
+                 max_background_tasks: int = 500, loop_lag_threshold: float = 0.5,
+                 trace_file: Optional[str] = None, startup_budget_ms: float = 3000.0,
+                 rate_limit: float = 30.0, ledger_sync_interval: float = 15.0,
+                 backup_dir: Optional[str] = None, backup_interval: float = 86400.0,
+                 backups_keep: int = 7, archive_after_days: int = 30,
+                 vacuum_idle_seconds: float = 60.0, record_file: Optional[str] = None):
+        """
+        Настройки процесса
+
+        Args:
+            tenants (List[TenantConfig]): Арендаторы (боты и кошельки) процесса
+            db_path (str): Путь к файлу базы данных
+            max_background_tasks (int): Лимит одновременных проверок оплаты
+            loop_lag_threshold (float): Порог зависания event loop, сек
+            trace_file (str): Файл для трассировки апдейтов (OTLP/JSON), пусто — выключено
+            startup_budget_ms (float): Бюджет холодного старта, мс: в работе — до
+                первого getUpdates, в bench_startup.py — до обработки первого апдейта
+            rate_limit (float): Общий лимит исходящих запросов к Telegram, в секунду
+            ledger_sync_interval (float): Интервал синхронизации журнала платежей, сек
+            backup_dir (str): Каталог онлайн-снимков базы, пусто — снимки выключены
+            backup_interval (float): Интервал между снимками, сек
+            backups_keep (int): Сколько последних снимков хранить
+            archive_after_days (int): Через сколько дней после окончания подписки
+                пользователь переносится в архив
+            vacuum_idle_seconds (float): Сколько секунд без апдейтов ждать перед VACUUM
+            record_file (str): Файл записи входящих апдейтов (.jsonl.gz), пусто — выключено
+        """
+        keys = [tenant.key for tenant in tenants]
+        if not tenants:
+            raise ValueError("Не задано ни одного арендатора")
+        if len(set(keys)) != len(keys):
+            raise ValueError("Ключи арендаторов должны быть уникальными")
+        self.tenants = tenants
+        self.db_path = db_path
+        self.max_background_tasks = max_background_tasks
+        self.loop_lag_threshold = loop_lag_threshold
+        self.trace_file = trace_file
+        self.startup_budget_ms = startup_budget_ms
+        self.rate_limit = rate_limit
+        self.ledger_sync_interval = ledger_sync_interval
+        self.backup_dir = backup_dir
+        self.backup_interval = backup_interval
+        self.backups_keep = backups_keep
+        self.archive_after_days = archive_after_days
+        self.vacuum_idle_seconds = vacuum_idle_seconds
+        self.record_file = record_file
+
+
+def load_tenants(path: str) -> List[TenantConfig]:
+    """
+    Читает арендаторов из JSON-файла вида
+    [{"key": "shop", "bot_token": "...", "yoomoney_token": "...",
+      "wallet_number": "...", "admin_ids": [1, 2]}, ...]
+
+    Raises:
+        ValueError: Если у арендатора не задан обязательный параметр
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    tenants = []
+    for entry in entries:
+        for field in ("key", "bot_token", "yoomoney_token", "wallet_number"):
+            if not entry.get(field):
+                raise ValueError(f"{field} не задан для арендатора в {path}")
+        tenants.append(TenantConfig(
+            key=entry["key"],
+            bot_token=entry["bot_token"],
+            yoomoney_token=entry["yoomoney_token"],
+            wallet_number=entry["wallet_number"],
+            admin_ids=entry.get("admin_ids", [])
+        ))
+    return tenants
+
+
+def load_config(env_path: str = ENV_PATH) -> Config:
+    """
+    Читает настройки из .env и переменных окружения. Если задан TENANTS_FILE,
+    арендаторы берутся из него, иначе единственный арендатор собирается из
+    BOT_TOKEN, YOOMONEY_ACCESS_TOKEN, YOOMONEY_RECEIVER и ADMIN_IDS
+
+    Raises:
+        ValueError: Если не задан обязательный параметр
+    """
+    load_dotenv(env_path)
+
+    tenants_file = os.getenv('TENANTS_FILE')
+    if tenants_file:
+        tenants = load_tenants(tenants_file)
+    else:
+        bot_token = os.getenv('BOT_TOKEN')
+        yoomoney_token = os.getenv('YOOMONEY_ACCESS_TOKEN')
+        wallet_number = os.getenv('YOOMONEY_RECEIVER')
+
+        # Проверка наличия необходимых токенов
+        if not bot_token:
+            raise ValueError("BOT_TOKEN не найден в переменных окружения")
+        if not yoomoney_token:
+            raise ValueError("YOOMONEY_TOKEN не найден в переменных окружения")
+        if not wallet_number:
+            raise ValueError("YOOMONEY_RECEIVER не найден в переменных окружения")
+
+        admin_ids = [int(x) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
+        tenants = [TenantConfig(DEFAULT_TENANT, bot_token, yoomoney_token, wallet_number, admin_ids)]
+
+    return Config(
+        tenants=tenants,
+        db_path=os.getenv('DB_PATH', 'bot_database.db'),
+        max_background_tasks=int(os.getenv('MAX_BACKGROUND_TASKS', '500')),
+        loop_lag_threshold=float(os.getenv('LOOP_LAG_THRESHOLD', '0.5')),
+        trace_file=os.getenv('TRACE_FILE') or None,
+        startup_budget_ms=float(os.getenv('STARTUP_BUDGET_MS', '3000')),
+        rate_limit=float(os.getenv('RATE_LIMIT', '30')),
+        ledger_sync_interval=float(os.getenv('LEDGER_SYNC_INTERVAL', '15')),
+        backup_dir=os.getenv('BACKUP_DIR') or None,
+        backup_interval=float(os.getenv('BACKUP_INTERVAL', '86400')),
+        backups_keep=int(os.getenv('BACKUPS_KEEP', '7')),
+        archive_after_days=int(os.getenv('ARCHIVE_AFTER_DAYS', '30')),
+        vacuum_idle_seconds=float(os.getenv('VACUUM_IDLE_SECONDS', '60')),
+        record_file=os.getenv('RECORD_FILE') or None
+    )
@@ -1,58 +1,214 @@
 import sqlite3
 import logging
 import datetime
+import asyncio
+import contextlib
+import contextvars
+import copy
 import aiosqlite
 import os
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable, Awaitable, Any
+
+from config import DEFAULT_TENANT
+from migrations import migrate
+from tracing import tracer, traced
+
+# Формат хранения дат в таблице users (с версии схемы 2 — ISO)
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Операция записи: получает соединение писателя, выполняется внутри общей транзакции
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+class ConnectionPool:
+    def __init__(self, db_path: str, readers: int = 4, commit_interval: float = 0.005,
+                 max_batch_size: int = 256):
+        """
+        Общий пул соединений с SQLite: несколько читающих соединений и один писатель
+        
+        Args:
+            db_path (str): Путь к файлу базы данных
+            readers (int): Количество читающих соединений
+            commit_interval (float): Сколько ждать попутных записей перед коммитом, сек
+            max_batch_size (int): Максимум операций в одной транзакции
+        """
+        self.db_path = db_path
+        self.readers = readers
+        self.commit_interval = commit_interval
+        self.max_batch_size = max_batch_size
+        self._readers: Optional[asyncio.Queue] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Открывает соединения и запускает корутину-писателя"""
+        async with self._start_lock:
+            if self._writer_task:
+                return
+            conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+
+            readers = asyncio.Queue()
+            for _ in range(self.readers):
+                reader = await aiosqlite.connect(self.db_path)
+                reader.row_factory = sqlite3.Row
+                readers.put_nowait(reader)
+            self._readers = readers
+
+            self._write_queue = asyncio.Queue()
+            # Писатель не должен наследовать трассу апдейта, в котором его запустили
+            self._writer_task = contextvars.Context().run(
+                asyncio.create_task, self._writer_loop(conn)
+            )
+
+    async def close(self) -> None:
+        """Дописывает очередь, останавливает писателя и закрывает соединения"""
+        if not self._writer_task:
+            return
+        await self._write_queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        for _ in range(self.readers):
+            reader = await self._readers.get()
+            await reader.close()
+
+    @contextlib.asynccontextmanager
+    async def reader(self):
+        """Выдает свободное читающее соединение на время блока"""
+        if not self._writer_task:
+            await self.start()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def write(self, op: WriteOp) -> Any:
+        """
+        Ставит операцию в очередь писателя и ждет коммита транзакции с ней
+        
+        Args:
+            op (WriteOp): Корутина, выполняющая запись через переданное соединение
+            
+        Returns:
+            Any: Результат операции
+        """
+        if not self._writer_task:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((op, future))
+        return await future
+
+    async def _writer_loop(self, conn: aiosqlite.Connection) -> None:
+        """
+        Единственный писатель: собирает накопившиеся операции и фиксирует их
+        одной транзакцией (group commit), чтобы всплеск платежей не упирался в fsync
+        """
+        try:
+            stopping = False
+            while not stopping:
+                item = await self._write_queue.get()
+                if item is None:
+                    break
+                batch = [item]
+
+                # Даем попутным записям несколько миллисекунд, чтобы попасть в ту же транзакцию
+                await asyncio.sleep(self.commit_interval)
+                while len(batch) < self.max_batch_size and not self._write_queue.empty():
+                    item = self._write_queue.get_nowait()
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                with tracer.span("db.group_commit", batch_size=len(batch)):
+                    results = []
+                    try:
+                        await conn.execute("BEGIN IMMEDIATE")
+                        for op, future in batch:
+                            # Точка сохранения изолирует ошибку одной операции от остальных
+                            await conn.execute("SAVEPOINT op")
+                            try:
+                                results.append((future, await op(conn), None))
+                                await conn.execute("RELEASE op")
+                            except Exception as e:
+                                await conn.execute("ROLLBACK TO op")
+                                await conn.execute("RELEASE op")
+                                results.append((future, None, e))
+                        await conn.execute("COMMIT")
+                    except Exception as e:
+                        logging.error(f"Ошибка при фиксации транзакции: {e}")
+                        if conn.in_transaction:
+                            await conn.execute("ROLLBACK")
+                        results = [(future, None, e) for _, future in batch]
+
+                # Результаты отдаем только после коммита
+                for future, result, error in results:
+                    if future.done():
+                        continue
+                    if error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+        finally:
+            await conn.close()
+
 
 class Database:
-    def __init__(self, db_path: str = "bot_database.db"):
+    def __init__(self, db_path: str = "bot_database.db", commit_interval: float = 0.005,
+                 max_batch_size: int = 256, readers: int = 4):
         """
         Инициализация подключения к базе данных SQLite
         
+        Экземпляр работает с данными арендатора DEFAULT_TENANT; представления
+        для других арендаторов создаются через for_tenant и делят с ним пул соединений.
+        
         Args:
             db_path (str): Путь к файлу базы данных
+            commit_interval (float): Сколько ждать попутных записей перед коммитом, сек
+            max_batch_size (int): Максимум операций в одной транзакции
+            readers (int): Количество читающих соединений в пуле
         """
         self.db_path = db_path
-        self._create_tables()
+        self.tenant = DEFAULT_TENANT
+        self._pool = ConnectionPool(db_path, readers, commit_interval, max_batch_size)
 
-    def _create_tables(self):
-        """Создает необходимые таблицы в базе данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Создаем таблицу, если она не существует
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    label TEXT,
-                    subscription_start TEXT,
-                    subscription_end TEXT,
-                    updated_at TEXT
-                )
-            """)
-            
-            # Проверяем существующие колонки
-            cursor.execute("PRAGMA table_info(users)")
-            existing_columns = {column[1] for column in cursor.fetchall()}
-            required_columns = {
-                'user_id', 'username', 'label', 
-                'subscription_start', 'subscription_end', 'updated_at'
-            }
-            
-            # Добавляем недостающие колонки
-            for column in required_columns - existing_columns:
-                if column == 'user_id':
-                    continue  # Пропускаем PRIMARY KEY
-                cursor.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
-            
-            conn.commit()
-            logging.info("Структура базы данных успешно обновлена")
+    def for_tenant(self, tenant: str) -> "Database":
+        """
+        Возвращает представление базы для арендатора с общим пулом соединений
+        
+        Args:
+            tenant (str): Ключ арендатора
+        """
+        view = copy.copy(self)
+        view.tenant = tenant
+        return view
+
+    async def init(self) -> None:
+        """Обновляет схему и запускает пул соединений; вызывается один раз при старте"""
+        await migrate(self.db_path)
+        await self.start()
+
+    async def start(self) -> None:
+        """Открывает соединения пула и запускает писателя"""
+        await self._pool.start()
+
+    async def close(self) -> None:
+        """Дописывает очередь записи и закрывает соединения"""
+        await self._pool.close()
+
+    async def _write(self, op: WriteOp) -> Any:
+        """Выполняет запись через общего писателя (group commit)"""
+        return await self._pool.write(op)
+
+    def _read(self):
+        """Читающее соединение из пула"""
+        return self._pool.reader()
 
     def _format_datetime(self, dt: datetime.datetime) -> str:
         """
-        Форматирует datetime в строку формата Д.М.Г Ч:M:C
+        Форматирует datetime в строку формата хранения (ГГГГ-ММ-ДД Ч:М:С)
         
         Args:
             dt (datetime): Объект datetime для форматирования
@@ -60,62 +216,150 @@ class Database:
         Returns:
             str: Отформатированная дата и время
         """
-        return dt.strftime("%d.%m.%Y %H:%M:%S")
+        return dt.strftime(DATETIME_FORMAT)
 
+    @traced("db.create_user")
     async def create_user(self, user_id: int, username: str, label: str, 
                          subscription_start: datetime.datetime, 
                          subscription_end: datetime.datetime) -> None:
-        """Создает нового пользователя или обновляет существующего"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """
+        Создает нового пользователя или перезаписывает существующего заданными
+        датами. Оплаченные подписки зачисляются через extend_subscription
+        """
+        async def op(db: aiosqlite.Connection) -> None:
             await db.execute("""
                 INSERT OR REPLACE INTO users 
-                (user_id, username, label, subscription_start, subscription_end, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
+                (tenant, user_id, username, label, subscription_start, subscription_end, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (
+                self.tenant,
                 user_id,
                 username,
                 label,
-                subscription_start.strftime("%d.%m.%Y %H:%M:%S"),
-                subscription_end.strftime("%d.%m.%Y %H:%M:%S"),
-                datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+                self._format_datetime(subscription_start),
+                self._format_datetime(subscription_end),
+                self._format_datetime(datetime.datetime.now())
             ))
-            await db.commit()
 
+        await self._write(op)
+
+    @traced("db.extend_subscription")
+    async def extend_subscription(self, user_id: int, username: str, label: str,
+                                  duration: datetime.timedelta) -> datetime.datetime:
+        """
+        Атомарно продлевает подписку: новая дата окончания равна
+        max(сейчас, текущее окончание) + duration. Если пользователя нет, он создается
+        
+        Args:
+            user_id (int): ID пользователя в Telegram
+            username (str): Имя пользователя
+            label (str): Label подписки
+            duration (timedelta): Срок продления
+            
+        Returns:
+            datetime: Новая дата окончания подписки
+        """
+        modifier = f"+{int(duration.total_seconds())} seconds"
+
+        async def op(db: aiosqlite.Connection) -> datetime.datetime:
+            await db.execute("""
+                INSERT INTO users
+                (tenant, user_id, username, label, subscription_start, subscription_end, updated_at)
+                VALUES (
+                    :tenant, :user_id, :username, :label,
+                    datetime('now', 'localtime'),
+                    datetime('now', 'localtime', :modifier),
+                    datetime('now', 'localtime')
+                )
+                ON CONFLICT(tenant, user_id) DO UPDATE SET
+                    label = excluded.label,
+                    -- Истекшая подписка начинается заново
+                    subscription_start = CASE
+                        WHEN users.subscription_end IS NULL
+                            OR users.subscription_end < datetime('now', 'localtime')
+                        THEN excluded.subscription_start
+                        ELSE users.subscription_start
+                    END,
+                    subscription_end = datetime(
+                        max(
+                            datetime('now', 'localtime'),
+                            COALESCE(users.subscription_end, datetime('now', 'localtime'))
+                        ),
+                        :modifier
+                    ),
+                    updated_at = excluded.updated_at
+            """, {
+                "tenant": self.tenant, "user_id": user_id, "username": username,
+                "label": label, "modifier": modifier
+            })
+            async with db.execute(
+                "SELECT subscription_end FROM users WHERE tenant = ? AND user_id = ?",
+                (self.tenant, user_id)
+            ) as cursor:
+                row = await cursor.fetchone()
+            return datetime.datetime.strptime(row[0], DATETIME_FORMAT)
+
+        return await self._write(op)
+
+    @traced("db.get_user")
     async def get_user(self, user_id: int) -> Optional[Dict]:
         """Получает информацию о пользователе"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self._read() as db:
             async with db.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
+                "SELECT * FROM users WHERE tenant = ? AND user_id = ?",
+                (self.tenant, user_id)
             ) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     return dict(row)
                 return None
 
+    @traced("db.get_all_users")
     async def get_all_users(self) -> List[Dict]:
         """Получает список всех пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            async with db.execute("SELECT * FROM users") as cursor:
+        async with self._read() as db:
+            async with db.execute("SELECT * FROM users WHERE tenant = ?", (self.tenant,)) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
+    @traced("db.get_expiring_users")
+    async def get_expiring_users(self, until: datetime.datetime) -> List[Dict]:
+        """
+        Получает пользователей, чья подписка закончится между сейчас и until
+        (по индексу idx_users_tenant_end)
+
+        Args:
+            until (datetime): Верхняя граница окончания подписки
+        """
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT * FROM users
+                WHERE tenant = ? AND subscription_end BETWEEN ? AND ?
+            """, (
+                self.tenant,
+                self._format_datetime(datetime.datetime.now()),
+                self._format_datetime(until)
+            )) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    @traced("db.update_user_label")
     async def update_user_label(self, user_id: int, label: str) -> None:
         """Обновляет label пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def op(db: aiosqlite.Connection) -> None:
             await db.execute("""
                 UPDATE users 
                 SET label = ?, updated_at = ?
-                WHERE user_id = ?
+                WHERE tenant = ? AND user_id = ?
             """, (
                 label,
-                datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+                self._format_datetime(datetime.datetime.now()),
+                self.tenant,
                 user_id
             ))
-            await db.commit()
 
+        await self._write(op)
+
+    @traced("db.get_user_subscription_info")
     async def get_user_subscription_info(self, user_id: int) -> Optional[Dict]:
         """Получает информацию о подписке пользователя"""
         user = await self.get_user(user_id)
@@ -126,4 +370,373 @@ class Database:
             "label": user["label"],
             "subscription_start": user["subscription_start"],
             "subscription_end": user["subscription_end"]
-        } 
\ No newline at end of file
+        }
+
+    @traced("db.upsert_payments")
+    async def upsert_payments(self, payments: List[Dict]) -> Dict[str, str]:
+        """
+        Сохраняет операции в журнал платежей; статус уже известных операций обновляется
+        
+        Args:
+            payments (List[Dict]): Операции с ключами operation_id, label, status,
+                direction, amount, title, operation_at (datetime)
+
+        Returns:
+            Dict[str, str]: label -> operation_id тех из сохраненных операций,
+                что оплачены и еще не зачислены (как get_paid_labels)
+        """
+        if not payments:
+            return {}
+        synced_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        async def op(db: aiosqlite.Connection) -> Dict[str, str]:
+            await db.executemany("""
+                INSERT INTO payments
+                (tenant, operation_id, label, status, direction, amount, title, operation_at, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(tenant, operation_id) DO UPDATE SET
+                    status = excluded.status,
+                    synced_at = excluded.synced_at
+            """, [
+                (
+                    self.tenant,
+                    p["operation_id"],
+                    p["label"],
+                    p["status"],
+                    p["direction"],
+                    p["amount"],
+                    p["title"],
+                    p["operation_at"].strftime("%Y-%m-%d %H:%M:%S") if p["operation_at"] else None,
+                    synced_at
+                )
+                for p in payments
+            ])
+            operation_ids = [p["operation_id"] for p in payments]
+            async with db.execute(f"""
+                SELECT label, operation_id FROM payments
+                WHERE tenant = ? AND operation_id IN ({", ".join("?" * len(operation_ids))})
+                    AND label IS NOT NULL AND status = 'success' AND direction = 'in'
+                    AND credited_at IS NULL AND rejected_at IS NULL
+            """, (self.tenant, *operation_ids)) as cursor:
+                return {label: operation_id for label, operation_id in await cursor.fetchall()}
+
+        return await self._write(op)
+
+    @traced("db.get_paid_labels")
+    async def get_paid_labels(self) -> Dict[str, str]:
+        """Возвращает словарь label -> operation_id успешных входящих, еще не зачисленных платежей"""
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT label, operation_id FROM payments
+                WHERE tenant = ? AND label IS NOT NULL AND status = 'success' AND direction = 'in'
+                    AND credited_at IS NULL AND rejected_at IS NULL
+            """, (self.tenant,)) as cursor:
+                return {label: operation_id for label, operation_id in await cursor.fetchall()}
+
+    @traced("db.mark_payment_credited")
+    async def mark_payment_credited(self, label: str, min_amount: float = 0.0) -> bool:
+        """
+        Отмечает успешный платеж по label как зачисленный. Платеж меньше
+        min_amount отмечается отклоненным и больше не предлагается к зачислению
+
+        Args:
+            label (str): Метка платежа
+            min_amount (float): Минимальная сумма, поступившая на кошелек, ₽
+
+        Returns:
+            bool: True, если платеж был, еще не был зачислен и сумма не меньше min_amount
+        """
+        processed_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        async def op(db: aiosqlite.Connection) -> bool:
+            async with db.execute("""
+                SELECT operation_id, amount FROM payments
+                WHERE tenant = ? AND label = ? AND status = 'success' AND direction = 'in'
+                    AND credited_at IS NULL AND rejected_at IS NULL
+            """, (self.tenant, label)) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                return False
+
+            operation_id, amount = row
+            credited = (amount or 0) >= min_amount
+            column = "credited_at" if credited else "rejected_at"
+            await db.execute(
+                f"UPDATE payments SET {column} = ? WHERE tenant = ? AND operation_id = ?",
+                (processed_at, self.tenant, operation_id)
+            )
+            if not credited:
+                logging.warning(
+                    f"Платеж {label} отклонен: поступило {amount}₽, ожидалось не меньше {min_amount:.2f}₽"
+                )
+            return credited
+
+        return await self._write(op)
+
+    @traced("db.create_invoice")
+    async def create_invoice(self, label: str, user_id: int, chat_id: int, plan_id: str,
+                             amount: float, is_extension: bool = False) -> None:
+        """
+        Сохраняет счет на оплату перед отправкой ссылки покупателю
+
+        Args:
+            label (str): Метка счета
+            user_id (int): ID покупателя
+            chat_id (int): Чат для уведомлений
+            plan_id (str): ID тарифа
+            amount (float): Цена тарифа на момент выставления счета, ₽
+            is_extension (bool): Продление, а не новая подписка
+        """
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute("""
+                INSERT INTO invoices
+                (tenant, label, user_id, chat_id, plan_id, is_extension, amount, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                self.tenant, label, user_id, chat_id, plan_id, int(is_extension), amount,
+                self._format_datetime(datetime.datetime.now())
+            ))
+
+        await self._write(op)
+
+    @traced("db.get_unclaimed_invoices")
+    async def get_unclaimed_invoices(self, created_before: datetime.datetime) -> List[Dict]:
+        """
+        Получает счета, выставленные раньше created_before, оплата которых
+        есть в журнале, но еще не зачислена и не отклонена
+
+        Args:
+            created_before (datetime): Верхняя граница времени выставления счета
+        """
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT invoices.* FROM payments
+                JOIN invoices ON invoices.tenant = payments.tenant AND invoices.label = payments.label
+                WHERE payments.tenant = ? AND payments.status = 'success' AND payments.direction = 'in'
+                    AND payments.credited_at IS NULL AND payments.rejected_at IS NULL
+                    AND invoices.created_at < ?
+            """, (self.tenant, self._format_datetime(created_before))) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    @traced("db.reject_payments_without_invoice")
+    async def reject_payments_without_invoice(self) -> List[str]:
+        """
+        Отмечает отклоненными успешные входящие платежи с меткой, для
+        которой нет счета
+
+        Returns:
+            List[str]: Метки отклоненных платежей
+        """
+        rejected_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        async def op(db: aiosqlite.Connection) -> List[str]:
+            async with db.execute("""
+                UPDATE payments SET rejected_at = ?
+                WHERE tenant = ? AND label IS NOT NULL AND status = 'success' AND direction = 'in'
+                    AND credited_at IS NULL AND rejected_at IS NULL
+                    AND NOT EXISTS (
+                        SELECT 1 FROM invoices
+                        WHERE invoices.tenant = payments.tenant AND invoices.label = payments.label
+                    )
+                RETURNING label
+            """, (rejected_at, self.tenant)) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+        return await self._write(op)
+
+    @traced("db.get_invoice")
+    async def get_invoice(self, label: str) -> Optional[Dict]:
+        """Получает счет по метке"""
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT * FROM invoices WHERE tenant = ? AND label = ?",
+                (self.tenant, label)
+            ) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return dict(row)
+                return None
+
+    @traced("db.get_payment_stats")
+    async def get_payment_stats(self, since: Optional[datetime.datetime] = None) -> Dict:
+        """
+        Считает количество и сумму успешных входящих платежей по журналу
+        
+        Args:
+            since (datetime): Учитывать операции начиная с этого момента (UTC)
+        """
+        query = """
+            SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM payments
+            WHERE tenant = ? AND status = 'success' AND direction = 'in'
+        """
+        params = (self.tenant,)
+        if since:
+            query += " AND operation_at >= ?"
+            params += (since.strftime("%Y-%m-%d %H:%M:%S"),)
+        async with self._read() as db:
+            async with db.execute(query, params) as cursor:
+                count, total = await cursor.fetchone()
+                return {"count": count, "total": total}
+
+    @traced("db.get_plans")
+    async def get_plans(self) -> List[Dict]:
+        """Получает тарифы в порядке отображения; срок подписки — в виде timedelta"""
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT * FROM plans WHERE tenant = ? ORDER BY position, plan_id",
+                (self.tenant,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+        plans = []
+        for row in rows:
+            plan = dict(row)
+            del plan["tenant"]
+            plan["duration"] = datetime.timedelta(seconds=plan.pop("duration_seconds"))
+            plans.append(plan)
+        return plans
+
+    async def save_plan(self, plan: Dict, position: int = 0) -> None:
+        """
+        Создает или перезаписывает тариф
+        
+        Args:
+            plan (Dict): Тариф с ключами plan_id, amount, duration, label, name, title
+            position (int): Порядок тарифа на клавиатуре
+        """
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute("""
+                INSERT OR REPLACE INTO plans
+                (tenant, plan_id, amount, duration_seconds, label, name, title, position)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                self.tenant,
+                plan["plan_id"],
+                plan["amount"],
+                int(plan["duration"].total_seconds()),
+                plan["label"],
+                plan["name"],
+                plan["title"],
+                position
+            ))
+
+        await self._write(op)
+
+    async def update_plan(self, plan_id: str, amount: int, duration: datetime.timedelta,
+                          name: Optional[str] = None, title: Optional[str] = None,
+                          label: Optional[str] = None) -> None:
+        """Обновляет цену, срок и те из названия, текста кнопки и label, что заданы"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute("""
+                UPDATE plans
+                SET amount = ?, duration_seconds = ?, name = COALESCE(?, name),
+                    title = COALESCE(?, title), label = COALESCE(?, label)
+                WHERE tenant = ? AND plan_id = ?
+            """, (amount, int(duration.total_seconds()), name, title, label, self.tenant, plan_id))
+
+        await self._write(op)
+
+    async def get_sync_state(self, key: str) -> Optional[str]:
+        """Читает служебное значение по ключу"""
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT value FROM sync_state WHERE tenant = ? AND key = ?",
+                (self.tenant, key)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def set_sync_state(self, key: str, value: str) -> None:
+        """Сохраняет служебное значение по ключу"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                "INSERT OR REPLACE INTO sync_state (tenant, key, value) VALUES (?, ?, ?)",
+                (self.tenant, key, value)
+            )
+
+        await self._write(op)
+
+    @traced("db.archive_expired_users")
+    async def archive_expired_users(self, before: datetime.datetime, batch_size: int = 500) -> int:
+        """
+        Переносит в users_archive одну пачку пользователей, чья подписка
+        закончилась раньше before. Каждая пачка — отдельная короткая запись,
+        поэтому большой перенос не задерживает остальные записи
+
+        Args:
+            before (datetime): Граница окончания подписки
+            batch_size (int): Максимум пользователей в пачке
+
+        Returns:
+            int: Сколько пользователей перенесено
+        """
+        archived_at = self._format_datetime(datetime.datetime.now())
+
+        async def op(db: aiosqlite.Connection) -> int:
+            async with db.execute("""
+                SELECT user_id FROM users
+                WHERE tenant = ? AND subscription_end < ?
+                LIMIT ?
+            """, (self.tenant, self._format_datetime(before), batch_size)) as cursor:
+                user_ids = [row[0] for row in await cursor.fetchall()]
+            if not user_ids:
+                return 0
+
+            placeholders = ", ".join("?" * len(user_ids))
+            await db.execute(f"""
+                INSERT OR REPLACE INTO users_archive
+                (tenant, user_id, username, label, subscription_start, subscription_end,
+                 updated_at, archived_at)
+                SELECT tenant, user_id, username, label, subscription_start, subscription_end,
+                       updated_at, ?
+                FROM users WHERE tenant = ? AND user_id IN ({placeholders})
+            """, (archived_at, self.tenant, *user_ids))
+            await db.execute(
+                f"DELETE FROM users WHERE tenant = ? AND user_id IN ({placeholders})",
+                (self.tenant, *user_ids)
+            )
+            return len(user_ids)
+
+        return await self._write(op)
+
+    @traced("db.backup")
+    async def backup(self, target_path: str) -> None:
+        """
+        Делает онлайн-снимок базы через backup API SQLite за один шаг.
+        Пошаговое копирование начинается заново после каждой записи в базу
+        с другого соединения и под нагрузкой может не закончиться никогда;
+        один шаг в режиме WAL читает согласованный снимок и писателя не блокирует
+
+        Args:
+            target_path (str): Файл снимка
+        """
+        async with aiosqlite.connect(self.db_path) as source:
+            async with aiosqlite.connect(target_path) as target:
+                await source.backup(target, pages=-1)
+
+    @traced("db.incremental_vacuum")
+    async def get_auto_vacuum(self) -> int:
+        """Режим auto_vacuum базы: 0 — выключен, 1 — полный, 2 — инкрементальный"""
+        async with self._read() as db:
+            async with db.execute("PRAGMA auto_vacuum") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def incremental_vacuum(self, pages: int = 256) -> int:
+        """
+        Возвращает файловой системе до pages свободных страниц
+
+        Args:
+            pages (int): Максимум страниц за вызов
+
+        Returns:
+            int: Сколько свободных страниц осталось
+        """
+        async def op(db: aiosqlite.Connection) -> int:
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                free = (await cursor.fetchone())[0]
+            # sqlite3 выполняет прагму одним шагом, а каждый шаг освобождает одну страницу
+            for _ in range(min(pages, free)):
+                await db.execute("PRAGMA incremental_vacuum")
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                return (await cursor.fetchone())[0]
+
+        return await self._write(op)
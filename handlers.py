@@ -4,12 +4,14 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from yoomoney import Client
 
-from keyboards import get_main_keyboard, get_subscription_keyboard
+from keyboards import get_main_keyboard
+from plans import PlanCatalog
 
 class MessageHandler:
-    def __init__(self, bot: Bot, yoomoney_client: Client):
+    def __init__(self, bot: Bot, yoomoney_client: Client, plans: PlanCatalog):
         self.bot = bot
         self.yoomoney_client = yoomoney_client
+        self.plans = plans
 
     async def cmd_start(self, message: Message):
         """Обработчик команды /start"""
@@ -25,11 +27,8 @@ class MessageHandler:
         
         # Отправляем сообщение с описанием и кнопками
         await callback_query.message.answer(
-            "Выберите подходящий вам тариф подписки:\n\n"
-            "🔹 Базовая - доступ к основным функциям\n"
-            "🔹 Стандартная - расширенный функционал\n"
-            "🔹 Премиум - полный доступ ко всем возможностям",
-            reply_markup=get_subscription_keyboard()
+            "Выберите подходящий вам тариф подписки:\n\n" + self.plans.description,
+            reply_markup=self.plans.subscription_keyboard
         )
 
     async def cancel_payment(self, callback_query: types.CallbackQuery):
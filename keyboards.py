@@ -22,16 +22,19 @@ def get_main_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 # Клавиатура выбора подписки
-def get_subscription_keyboard() -> InlineKeyboardMarkup:
-    """Создает клавиатуру с тарифами подписок"""
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🔹 День - 90₽", callback_data="sub_basic")],
-            [InlineKeyboardButton(text="🔹 Неделя - 440₽", callback_data="sub_standard")],
-            [InlineKeyboardButton(text="🔹 Месяц - 1620₽", callback_data="sub_premium")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_payment")]
-        ]
-    )
+def get_subscription_keyboard(plans: list) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру с тарифами подписок
+    
+    Args:
+        plans (list): Тарифы каталога (plan_id, title, amount)
+    """
+    keyboard = [
+        [InlineKeyboardButton(text=f"🔹 {plan['title']} - {plan['amount']}₽", callback_data=plan["plan_id"])]
+        for plan in plans
+    ]
+    keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_payment")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 # Клавиатура оплаты
 def get_payment_keyboard(payment_url: str) -> InlineKeyboardMarkup:
@@ -43,6 +46,20 @@ def get_payment_keyboard(payment_url: str) -> InlineKeyboardMarkup:
         ]
     )
 
+def get_plans_settings_keyboard(plans: list) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру настройки тарифов
+    
+    Args:
+        plans (list): Тарифы каталога (plan_id, name)
+    """
+    keyboard = [
+        [InlineKeyboardButton(text=f"✏️ {plan['name']}", callback_data=f"admin_plan_{plan['plan_id']}")]
+        for plan in plans
+    ]
+    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_admin_keyboard(is_test_mode: bool = False) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру для админ-панели
@@ -60,6 +77,7 @@ def get_admin_keyboard(is_test_mode: bool = False) -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
             [InlineKeyboardButton(text="💰 Баланс", callback_data="admin_balance")],
             [InlineKeyboardButton(text="⚙️ Настройки", callback_data="admin_settings")],
+            [InlineKeyboardButton(text="🔬 Профилировать 30 с", callback_data="admin_profile")],
             [InlineKeyboardButton(text="🔙 Вернуться в главное меню", callback_data="back_to_main")]
         ]
     ) 
\ No newline at end of file
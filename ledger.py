@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+from yoomoney import Client
+
+from database import Database
+from tracing import tracer
+
+# Ключ в sync_state, под которым хранится позиция синхронизации
+CURSOR_KEY = "ledger_last_operation_at"
+CURSOR_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _to_utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    """
+    Приводит время операции к UTC без часового пояса. SDK отдает время
+    со смещением, если оно есть в ответе ЮMoney, и без него для «Z»
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class PaymentLedger:
+    def __init__(self, yoomoney_client: Client, db: Database,
+                 sync_requested: Optional[asyncio.Event] = None, page_size: int = 100,
+                 overlap: datetime.timedelta = datetime.timedelta(minutes=10),
+                 initial_lookback: datetime.timedelta = datetime.timedelta(days=30),
+                 commission: float = 0.03):
+        """
+        Локальный журнал платежей, инкрементально зеркалирующий историю ЮMoney
+
+        Args:
+            yoomoney_client (Client): Клиент ЮMoney
+            db (Database): База данных
+            sync_requested (asyncio.Event): Событие внеочередной синхронизации;
+                может быть общим для журналов нескольких арендаторов
+            page_size (int): Количество записей на страницу operation_history
+            overlap (timedelta): Насколько заходить назад от последней позиции,
+                чтобы подхватить смену статуса недавних операций
+            initial_lookback (timedelta): Глубина первой синхронизации
+            commission (float): Доля цены, которую ЮMoney удерживает с платежа:
+                в истории операций amount — сумма, поступившая на кошелек
+        """
+        self.yoomoney_client = yoomoney_client
+        self.db = db
+        self.page_size = page_size
+        self.overlap = overlap
+        self.initial_lookback = initial_lookback
+        self.commission = commission
+        self._paid_labels: Dict[str, str] = {}
+        self._cursor: Optional[datetime.datetime] = None
+        self._sync_requested = sync_requested or asyncio.Event()
+        self._sync_lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        """Загружает индекс оплаченных label и позицию синхронизации из базы"""
+        self._paid_labels = await self.db.get_paid_labels()
+        cursor = await self.db.get_sync_state(CURSOR_KEY)
+        if cursor:
+            self._cursor = datetime.datetime.strptime(cursor, CURSOR_FORMAT)
+        logging.info(f"Журнал платежей загружен: {len(self._paid_labels)} оплаченных label")
+
+    def is_paid(self, label: str) -> bool:
+        """Проверяет по локальному индексу, поступила ли и еще не зачислена оплата по label"""
+        return label in self._paid_labels
+
+    async def claim(self, label: str, price: float) -> bool:
+        """
+        Отмечает оплату по label как зачисленную. Подписку за платеж можно
+        выдать, только если claim вернул True: повторно тот же платеж не засчитается.
+        Покупатель может изменить сумму в ссылке на форму оплаты, поэтому
+        платеж меньше цены счета (за вычетом комиссии) отклоняется
+
+        Args:
+            label (str): Метка платежа
+            price (float): Цена из счета, ₽
+        """
+        min_amount = round(price * (1 - self.commission), 2)
+        credited = await self.db.mark_payment_credited(label, min_amount)
+        self._paid_labels.pop(label, None)
+        return credited
+
+    async def reject_without_invoice(self) -> List[str]:
+        """
+        Отклоняет оплаты с меткой, для которой не выставлялся счет: зачислять
+        их некому, а в индексе они копились бы до перезапуска
+
+        Returns:
+            List[str]: Метки отклоненных платежей
+        """
+        labels = await self.db.reject_payments_without_invoice()
+        for label in labels:
+            self._paid_labels.pop(label, None)
+        return labels
+
+    @property
+    def sync_requested(self) -> asyncio.Event:
+        """Событие внеочередной синхронизации для фонового цикла"""
+        return self._sync_requested
+
+    def request_sync(self) -> None:
+        """Просит фоновый цикл синхронизироваться, не дожидаясь интервала"""
+        self._sync_requested.set()
+
+    async def sync(self) -> int:
+        """
+        Забирает из ЮMoney операции новее сохраненной позиции
+
+        Returns:
+            int: Количество полученных операций
+        """
+        async with self._sync_lock:
+            with tracer.span("ledger.sync") as span:
+                from_date = (self._cursor - self.overlap if self._cursor
+                             else datetime.datetime.utcnow() - self.initial_lookback)
+                start_record = None
+                newest = self._cursor
+                fetched = 0
+
+                while True:
+                    # Клиент синхронный — уводим запрос из event loop
+                    with tracer.span("yoomoney.operation_history", start_record=str(start_record)):
+                        history = await asyncio.to_thread(
+                            self.yoomoney_client.operation_history,
+                            from_date=from_date,
+                            start_record=start_record,
+                            records=self.page_size
+                        )
+
+                    payments = [
+                        {
+                            "operation_id": operation.operation_id,
+                            "label": operation.label,
+                            "status": operation.status,
+                            "direction": operation.direction,
+                            "amount": operation.amount,
+                            "title": operation.title,
+                            "operation_at": _to_utc(operation.datetime)
+                        }
+                        for operation in history.operations
+                        if operation.operation_id
+                    ]
+                    # Окно перекрытия перечитывает и уже зачисленные платежи:
+                    # в индекс попадают только те, что база еще не отметила
+                    self._paid_labels.update(await self.db.upsert_payments(payments))
+                    fetched += len(payments)
+
+                    for payment in payments:
+                        if payment["operation_at"] and (newest is None or payment["operation_at"] > newest):
+                            newest = payment["operation_at"]
+
+                    if not history.next_record:
+                        break
+                    start_record = history.next_record
+
+                if newest and newest != self._cursor:
+                    self._cursor = newest
+                    await self.db.set_sync_state(CURSOR_KEY, newest.strftime(CURSOR_FORMAT))
+
+                span.set_attribute("ledger.fetched", fetched)
+                return fetched
@@ -0,0 +1,158 @@
+import datetime
+import glob
+import logging
+import os
+import time
+from typing import List, Optional
+
+from aiogram import BaseMiddleware
+
+from database import Database
+
+
+class Maintenance:
+    def __init__(self, db: Database, tenants: List[str], backup_dir: Optional[str] = None,
+                 backup_interval: float = 86400.0, backups_keep: int = 7,
+                 archive_after: datetime.timedelta = datetime.timedelta(days=30),
+                 archive_batch_size: int = 500, idle_after: float = 60.0,
+                 vacuum_pages: int = 256):
+        """
+        Обслуживание базы: архив пользователей с давно истекшей подпиской,
+        онлайн-снимки и инкрементальный VACUUM в периоды простоя
+
+        Args:
+            db (Database): База данных
+            tenants (List[str]): Ключи арендаторов, чьих пользователей архивировать
+            backup_dir (str): Каталог снимков; None — снимки выключены
+            backup_interval (float): Как часто делать снимок, сек
+            backups_keep (int): Сколько последних снимков хранить
+            archive_after (timedelta): Через сколько после окончания подписки
+                пользователь переносится в архив
+            archive_batch_size (int): Пользователей в одной пачке переноса
+            idle_after (float): Сколько секунд без апдейтов считается простоем
+            vacuum_pages (int): Страниц за один шаг VACUUM
+        """
+        self.db = db
+        self.tenants = tenants
+        self.backup_dir = backup_dir
+        self.backup_interval = backup_interval
+        self.backups_keep = backups_keep
+        self.archive_after = archive_after
+        self.archive_batch_size = archive_batch_size
+        self.idle_after = idle_after
+        self.vacuum_pages = vacuum_pages
+        self._last_activity = time.monotonic()
+        # Включен ли auto_vacuum=INCREMENTAL; проверяется при первом VACUUM
+        self._incremental_vacuum: Optional[bool] = None
+
+    def mark_activity(self) -> None:
+        """Отмечает, что бот обрабатывает апдейты"""
+        self._last_activity = time.monotonic()
+
+    @property
+    def idle(self) -> bool:
+        """Не было апдейтов дольше idle_after секунд"""
+        return time.monotonic() - self._last_activity >= self.idle_after
+
+    async def archive_expired(self) -> int:
+        """
+        Переносит в архив пользователей, чья подписка закончилась раньше
+        чем archive_after назад
+
+        Returns:
+            int: Сколько пользователей перенесено
+        """
+        before = datetime.datetime.now() - self.archive_after
+        total = 0
+        for tenant in self.tenants:
+            db = self.db.for_tenant(tenant)
+            while True:
+                moved = await db.archive_expired_users(before, self.archive_batch_size)
+                total += moved
+                if moved < self.archive_batch_size:
+                    break
+        if total:
+            logging.info(f"В архив перенесено пользователей: {total}")
+        return total
+
+    def _backups(self) -> List[str]:
+        """Снимки в каталоге, от старых к новым"""
+        name = os.path.splitext(os.path.basename(self.db.db_path))[0]
+        return sorted(glob.glob(os.path.join(self.backup_dir, f"{name}-*.db")))
+
+    async def backup(self, force: bool = False) -> Optional[str]:
+        """
+        Делает снимок базы, если последний старше backup_interval, и удаляет
+        лишние старые снимки
+
+        Args:
+            force (bool): Сделать снимок независимо от возраста последнего
+
+        Returns:
+            str: Путь к новому снимку или None, если снимок не понадобился
+        """
+        if not self.backup_dir:
+            return None
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+        backups = self._backups()
+        if not force and backups and time.time() - os.path.getmtime(backups[-1]) < self.backup_interval:
+            return None
+
+        name = os.path.splitext(os.path.basename(self.db.db_path))[0]
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.backup_dir, f"{name}-{stamp}.db")
+        # Пишем во временный файл, чтобы недописанный снимок не выглядел готовым
+        tmp_path = path + ".tmp"
+        started = time.perf_counter()
+        try:
+            await self.db.backup(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logging.info(f"Снимок базы сохранен в {path} за {time.perf_counter() - started:.1f} с")
+
+        for old in self._backups()[:-self.backups_keep]:
+            os.remove(old)
+        return path
+
+    async def vacuum_if_idle(self) -> int:
+        """
+        В простое возвращает файловой системе свободные страницы базы,
+        по vacuum_pages за шаг, пока бот не получит апдейт
+
+        Returns:
+            int: Сколько шагов выполнено
+        """
+        if self._incremental_vacuum is None:
+            # migrate() включает режим только при обновлении схемы, поэтому
+            # скопированная или восстановленная база может оказаться без него
+            self._incremental_vacuum = await self.db.get_auto_vacuum() == 2
+            if not self._incremental_vacuum:
+                logging.warning("auto_vacuum базы не INCREMENTAL, инкрементальный VACUUM пропускается")
+        if not self._incremental_vacuum:
+            return 0
+
+        steps = 0
+        remaining = None
+        while self.idle:
+            previous, remaining = remaining, await self.db.incremental_vacuum(self.vacuum_pages)
+            steps += 1
+            # Страницы не освобождаются — дальнейшие шаги только заняли бы писателя
+            if remaining == 0 or (previous is not None and remaining >= previous):
+                break
+        if steps > 1:
+            logging.info(f"Инкрементальный VACUUM: {steps} шагов по {self.vacuum_pages} страниц")
+        return steps
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Отмечает активность бота, чтобы обслуживание базы шло только в простое"""
+
+    def __init__(self, maintenance: Maintenance):
+        self.maintenance = maintenance
+
+    async def __call__(self, handler, event, data):
+        self.maintenance.mark_activity()
+        return await handler(event, data)
@@ -0,0 +1,333 @@
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+import aiosqlite
+
+# Схема версии 1; {name} подставляется при создании и пересборке.
+# Менять эти строки нельзя: изменения схемы оформляются новой миграцией
+_USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        label TEXT,
+        subscription_start TEXT,
+        subscription_end TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (tenant, user_id)
+    )
+"""
+
+_PAYMENTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        operation_id TEXT NOT NULL,
+        label TEXT,
+        status TEXT,
+        direction TEXT,
+        amount REAL,
+        title TEXT,
+        operation_at TEXT,
+        synced_at TEXT,
+        PRIMARY KEY (tenant, operation_id)
+    )
+"""
+
+_PLANS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        plan_id TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        duration_seconds INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        name TEXT NOT NULL,
+        title TEXT NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (tenant, plan_id)
+    )
+"""
+
+_USERS_ARCHIVE_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        label TEXT,
+        subscription_start TEXT,
+        subscription_end TEXT,
+        updated_at TEXT,
+        archived_at TEXT,
+        PRIMARY KEY (tenant, user_id)
+    )
+"""
+
+_SYNC_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (tenant, key)
+    )
+"""
+
+# Счета на оплату (с версии 4): по label находится покупатель, тариф и цена
+_INVOICES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        label TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        plan_id TEXT NOT NULL,
+        is_extension INTEGER NOT NULL DEFAULT 0,
+        amount REAL NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (tenant, label)
+    )
+"""
+
+# Даты в users до версии 2 хранились как Д.М.Г Ч:М:С
+_LEGACY_DATE_PATTERN = "__.__.____ __:__:__"
+
+# Колонки с датами, которые версия 2 переводит в ISO
+_DATE_COLUMNS = {
+    "users": ("subscription_start", "subscription_end", "updated_at"),
+    "users_archive": ("subscription_start", "subscription_end", "updated_at", "archived_at")
+}
+
+
+class Migration:
+    def __init__(self, version: int, description: str,
+                 apply: Callable[[aiosqlite.Connection], Awaitable[None]],
+                 backfill: Optional[Callable[[aiosqlite.Connection, int], Awaitable[int]]] = None):
+        """
+        Шаг миграции схемы
+
+        Args:
+            version (int): Версия схемы после шага (PRAGMA user_version)
+            description (str): Описание для лога
+            apply (Callable): Изменение схемы; выполняется одной транзакцией.
+                Без backfill в ту же транзакцию входит запись новой версии, с
+                backfill версия записывается после переноса данных, поэтому
+                apply должен быть повторяемым (см. _add_column)
+            backfill (Callable): Перенос данных пачками, выполняется после apply,
+                так что может заполнять добавленные им колонки. Получает
+                соединение и размер пачки, возвращает число обработанных строк;
+                вызывается, пока пачка не окажется неполной. Каждая пачка —
+                своя транзакция, поэтому перенос должен быть идемпотентным: после
+                прерывания он продолжится с оставшихся строк
+        """
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.backfill = backfill
+
+
+async def _add_column(conn: aiosqlite.Connection, table: str, column: str, definition: str) -> None:
+    """Добавляет колонку, если ее еще нет; годится для повторяемых миграций"""
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if column not in columns:
+        await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def _add_tenant_column(conn: aiosqlite.Connection, table: str, schema: str) -> None:
+    """
+    Пересобирает таблицу без колонки tenant: ключ арендатора входит в первичный ключ,
+    поэтому простого ALTER TABLE недостаточно. Строки получают арендатора по умолчанию
+    """
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = [column[1] for column in await cursor.fetchall()]
+    if "tenant" in columns:
+        return
+
+    column_list = ", ".join(columns)
+    await conn.execute(schema.format(name=f"{table}_new"))
+    await conn.execute(
+        f"INSERT INTO {table}_new ({column_list}) SELECT {column_list} FROM {table}"
+    )
+    await conn.execute(f"DROP TABLE {table}")
+    await conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    logging.info(f"Таблица {table} переведена на ключ арендатора")
+
+
+async def _v1_baseline(conn: aiosqlite.Connection) -> None:
+    """
+    Схема на момент появления версий. Базы без версии могли быть созданы любой
+    прежней редакцией бота, поэтому шаг доводит до нее и старые таблицы
+    """
+    await conn.execute(_USERS_TABLE.format(name="users"))
+
+    # Самые старые базы: users без части колонок
+    async with conn.execute("PRAGMA table_info(users)") as cursor:
+        existing_columns = {column[1] for column in await cursor.fetchall()}
+    for column in ('username', 'label', 'subscription_start', 'subscription_end', 'updated_at'):
+        if column not in existing_columns:
+            await conn.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
+
+    await conn.execute(_PAYMENTS_TABLE.format(name="payments"))
+    await conn.execute(_PLANS_TABLE.format(name="plans"))
+    await conn.execute(_SYNC_STATE_TABLE.format(name="sync_state"))
+    await conn.execute(_USERS_ARCHIVE_TABLE.format(name="users_archive"))
+
+    # Таблицы, созданные до мультиарендности, пересобираем с ключом арендатора
+    for table, schema in (("users", _USERS_TABLE), ("payments", _PAYMENTS_TABLE),
+                          ("plans", _PLANS_TABLE), ("sync_state", _SYNC_STATE_TABLE)):
+        await _add_tenant_column(conn, table, schema)
+
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_tenant_label ON payments (tenant, label)"
+    )
+
+
+def _legacy_to_iso(column: str) -> str:
+    """SQL-выражение, переводящее колонку из Д.М.Г Ч:М:С в ГГГГ-ММ-ДД Ч:М:С"""
+    return (
+        f"CASE WHEN {column} LIKE '{_LEGACY_DATE_PATTERN}' THEN "
+        f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || "
+        f"substr({column}, 1, 2) || ' ' || substr({column}, 12, 8) "
+        f"ELSE {column} END"
+    )
+
+
+async def _v2_backfill_iso_dates(conn: aiosqlite.Connection, batch_size: int) -> int:
+    """Переводит пачку строк users и users_archive на даты в ISO"""
+    changed = 0
+    for table, columns in _DATE_COLUMNS.items():
+        assignments = ", ".join(f"{column} = {_legacy_to_iso(column)}" for column in columns)
+        legacy = " OR ".join(f"{column} LIKE '{_LEGACY_DATE_PATTERN}'" for column in columns)
+        cursor = await conn.execute(f"""
+            UPDATE {table} SET {assignments}
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE {legacy} LIMIT ?)
+        """, (batch_size - changed,))
+        changed += cursor.rowcount
+        await cursor.close()
+        if changed >= batch_size:
+            break
+    return changed
+
+
+async def _v2_iso_dates(conn: aiosqlite.Connection) -> None:
+    """Даты в ISO сортируются как строки, поэтому по окончанию подписки можно строить индекс"""
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_tenant_end ON users (tenant, subscription_end)"
+    )
+
+
+async def _v3_credited_payments(conn: aiosqlite.Connection) -> None:
+    """Отметка о зачислении платежа: по одному label подписка выдается один раз"""
+    await _add_column(conn, "payments", "credited_at", "TEXT")
+
+
+async def _v3_backfill_credited(conn: aiosqlite.Connection, batch_size: int) -> int:
+    """Платежи, полученные до версии 3, уже были зачислены"""
+    cursor = await conn.execute("""
+        UPDATE payments SET credited_at = synced_at
+        WHERE rowid IN (
+            SELECT rowid FROM payments
+            WHERE credited_at IS NULL AND status = 'success' AND direction = 'in'
+            LIMIT ?
+        )
+    """, (batch_size,))
+    changed = cursor.rowcount
+    await cursor.close()
+    return changed
+
+
+async def _v4_invoices(conn: aiosqlite.Connection) -> None:
+    """
+    Счета с ожидаемой суммой: ссылка на форму оплаты не защищает сумму от
+    изменения покупателем, поэтому платеж сверяется с ценой счета.
+    Платеж меньше цены отмечается rejected_at и не зачисляется
+    """
+    await conn.execute(_INVOICES_TABLE.format(name="invoices"))
+    await _add_column(conn, "payments", "rejected_at", "TEXT")
+
+
+# Миграции в порядке версий; новая миграция добавляется в конец
+MIGRATIONS: List[Migration] = [
+    Migration(1, "базовая схема", _v1_baseline),
+    Migration(2, "даты пользователей в ISO", _v2_iso_dates, backfill=_v2_backfill_iso_dates),
+    Migration(3, "зачисление платежей", _v3_credited_payments, backfill=_v3_backfill_credited),
+    Migration(4, "счета на оплату", _v4_invoices),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+async def _in_transaction(conn: aiosqlite.Connection, func: Callable[[], Awaitable]):
+    """Выполняет func в транзакции и откатывает ее при ошибке"""
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = await func()
+        await conn.execute("COMMIT")
+        return result
+    except BaseException:
+        await conn.execute("ROLLBACK")
+        raise
+
+
+async def migrate(db_path: str, batch_size: int = 1000) -> int:
+    """
+    Доводит схему базы до SCHEMA_VERSION. Если схема актуальна, все
+    сводится к чтению PRAGMA user_version
+
+    Args:
+        db_path (str): Путь к файлу базы данных
+        batch_size (int): Размер пачки при переносе данных
+
+    Returns:
+        int: Версия схемы до миграции
+
+    Raises:
+        RuntimeError: Если база создана более новой версией бота
+    """
+    async with aiosqlite.connect(db_path, isolation_level=None) as conn:
+        async with conn.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        if version == SCHEMA_VERSION:
+            return version
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Версия схемы базы {version} новее поддерживаемой {SCHEMA_VERSION}"
+            )
+
+        # Инкрементальная очистка освобожденных страниц (см. Database.incremental_vacuum);
+        # режим задается до создания таблиц, у существующего файла — полным VACUUM
+        async with conn.execute("PRAGMA auto_vacuum") as cursor:
+            enable_auto_vacuum = (await cursor.fetchone())[0] != 2
+        if enable_auto_vacuum:
+            await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            async def set_version():
+                await conn.execute(f"PRAGMA user_version = {migration.version}")
+
+            async def apply():
+                await migration.apply(conn)
+                if not migration.backfill:
+                    await set_version()
+
+            await _in_transaction(conn, apply)
+
+            if migration.backfill:
+                total = 0
+                while True:
+                    changed = await _in_transaction(
+                        conn, lambda: migration.backfill(conn, batch_size)
+                    )
+                    total += changed
+                    if changed < batch_size:
+                        break
+                if total:
+                    logging.info(f"Миграция {migration.version}: перенесено строк: {total}")
+                # Версия фиксируется, только когда перенесены все данные
+                await _in_transaction(conn, set_version)
+            logging.info(f"Схема базы обновлена до версии {migration.version}: {migration.description}")
+
+        if enable_auto_vacuum:
+            await conn.execute("VACUUM")
+            logging.info("Для базы данных включен режим auto_vacuum = INCREMENTAL")
+        return version
@@ -0,0 +1,155 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5):
+        """
+        Детектор зависаний event loop
+
+        Корутина-пульс раз в interval отмечает время; отдельный поток-сторож
+        замечает, что пульса нет дольше threshold, и пишет в лог стек кода,
+        который в этот момент держит event loop.
+
+        Args:
+            interval (float): Период пульса, сек
+            threshold (float): Задержка, после которой loop считается зависшим, сек
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Запускает пульс и поток-сторож; вызывается из event loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Останавливает мониторинг"""
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _heartbeat(self) -> None:
+        """Измеряет задержку event loop относительно ожидаемого пробуждения"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.monotonic()
+            lag = self._last_beat - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                logging.warning(f"Event loop был заблокирован на {lag * 1000:.0f} мс")
+
+    def _watch(self) -> None:
+        """Поток-сторож: снимает стек loop-потока во время зависания"""
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat
+            if stalled_for <= self.threshold or reported_beat == beat:
+                continue
+            # Один стек на одно зависание
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logging.warning(
+                f"Event loop не отвечает {stalled_for * 1000:.0f} мс, блокирующий код:\n{stack}"
+            )
+
+
+class SamplingProfiler:
+    def __init__(self, sample_interval: float = 0.005):
+        """
+        Сэмплирующий профилировщик потока event loop
+
+        Args:
+            sample_interval (float): Период снятия стека, сек
+        """
+        self.sample_interval = sample_interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, duration: float, top: int = 30) -> str:
+        """
+        Снимает стеки текущего потока в течение duration секунд
+
+        Args:
+            duration (float): Длительность профилирования, сек
+            top (int): Сколько самых горячих функций включить в отчет
+
+        Returns:
+            str: Текстовый отчет
+        """
+        async with self._lock:
+            thread_id = threading.get_ident()
+            own_counts, total_counts, samples = await asyncio.to_thread(
+                self._sample, thread_id, duration
+            )
+        return self._format_report(own_counts, total_counts, samples, duration, top)
+
+    def _sample(self, thread_id: int, duration: float):
+        """Цикл сэмплирования, выполняется в отдельном потоке"""
+        own_counts = collections.Counter()
+        total_counts = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                samples += 1
+                own_counts[_frame_key(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = _frame_key(frame)
+                    if key not in seen:
+                        seen.add(key)
+                        total_counts[key] += 1
+                    frame = frame.f_back
+            time.sleep(self.sample_interval)
+        return own_counts, total_counts, samples
+
+    @staticmethod
+    def _format_report(own_counts, total_counts, samples: int, duration: float, top: int) -> str:
+        """Формирует отчет по собственному и суммарному времени функций"""
+        lines = [f"Профиль event loop: {duration:.0f} с, {samples} сэмплов", ""]
+        if not samples:
+            return "\n".join(lines)
+        for title, counts in (("Собственное время", own_counts),
+                              ("Суммарное время (с вызываемыми)", total_counts)):
+            lines.append(title)
+            lines.append(f"{'%':>7}  {'сэмплы':>7}  функция")
+            for key, count in counts.most_common(top):
+                lines.append(f"{count * 100 / samples:6.1f}%  {count:7d}  {key}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def _frame_key(frame) -> str:
+    """Идентификатор функции кадра: имя, файл и строка определения"""
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
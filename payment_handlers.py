@@ -1,56 +1,47 @@
 import asyncio
 import logging
 import datetime
+import secrets
+from typing import Dict
 from aiogram import Bot, types
 from aiogram import Dispatcher
-from yoomoney import Client, Quickpay
-from keyboards import get_payment_keyboard, get_subscription_keyboard
-from database import Database
+from yoomoney import Client
+from keyboards import get_payment_keyboard
+from database import Database, DATETIME_FORMAT
+from ledger import PaymentLedger
+from tasks import TaskSupervisor
+from plans import PlanCatalog
+from payment_links import PaymentLinkBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from tracing import traced
+
+# Сколько check_payment ждет оплату счета; более поздние оплаты зачисляет сверка
+PAYMENT_CHECK_TIMEOUT = datetime.timedelta(minutes=10)
+PAYMENT_CHECK_INTERVAL = 5
+
+
+def _new_label(user_id: int, plan_id: str, is_extension: bool = False) -> str:
+    """
+    Метка нового счета. Случайный суффикс делает ее уникальной, чтобы
+    прошлая оплата того же тарифа не засчиталась за новую покупку
+    """
+    prefix = "extend_" if is_extension else ""
+    return f"{user_id}_{prefix}{plan_id}_{secrets.token_hex(4)}"
 
-# Словарь с ценами и названиями подписок
-SUBSCRIPTION_PRICES = {
-    "sub_basic": {
-        "amount": 90,
-        "name": "Подписка на день",
-        "label": "basic_user",
-        "duration": datetime.timedelta(days=1)
-    },
-    "sub_standard": {
-        "amount": 440,
-        "name": "Подписка на неделю",
-        "label": "standard_user",
-        "duration": datetime.timedelta(days=7)
-    },
-    "sub_premium": {
-        "amount": 1620,
-        "name": "Подписка на месяц",
-        "label": "premium_user",
-        "duration": datetime.timedelta(days=30)
-    }
-}
 
 class PaymentHandler:
-    def __init__(self, bot: Bot, yoomoney_client: Client, wallet_number: str, db: Database):
+    def __init__(self, bot: Bot, yoomoney_client: Client, wallet_number: str, db: Database,
+                 ledger: PaymentLedger, tasks: TaskSupervisor, plans: PlanCatalog):
         self.bot = bot
         self.yoomoney_client = yoomoney_client
         self.wallet_number = wallet_number
         self.db = db
-        self._check_subscriptions_task = None
-
-    async def start_background_tasks(self):
-        """Запускает фоновые задачи"""
-        self._check_subscriptions_task = asyncio.create_task(self.check_expiring_subscriptions())
-
-    async def stop_background_tasks(self):
-        """Останавливает фоновые задачи"""
-        if self._check_subscriptions_task:
-            self._check_subscriptions_task.cancel()
-            try:
-                await self._check_subscriptions_task
-            except asyncio.CancelledError:
-                pass
+        self.ledger = ledger
+        self.tasks = tasks
+        self.plans = plans
+        self.payment_links = PaymentLinkBuilder(wallet_number)
 
+    @traced("payment.assign_user_label")
     async def assign_user_label(self, user_id: int, username: str, subscription_type: str) -> None:
         """
         Присваивает индивидуальный label пользователю после успешной оплаты
@@ -62,20 +53,16 @@ class PaymentHandler:
         """
         try:
             # Получаем информацию о подписке
-            sub_info = SUBSCRIPTION_PRICES[subscription_type]
+            sub_info = self.plans.plans[subscription_type]
             user_label = sub_info["label"]
             
-            # Рассчитываем время начала и окончания подписки
-            start_time = datetime.datetime.now()
-            end_time = start_time + sub_info["duration"]
-            
-            # Сохраняем информацию в базу данных
-            await self.db.create_user(
+            # Одним запросом сдвигаем окончание от max(сейчас, текущее окончание):
+            # оплаченный срок не теряется, даже если два платежа зачисляются одновременно
+            end_time = await self.db.extend_subscription(
                 user_id=user_id,
                 username=username,
                 label=user_label,
-                subscription_start=start_time,
-                subscription_end=end_time
+                duration=sub_info["duration"]
             )
             
             # Отправляем единое сообщение с информацией о подписке и кнопкой
@@ -104,42 +91,26 @@ class PaymentHandler:
             )
 
     async def check_expiring_subscriptions(self):
-        """Фоновая задача для проверки окончания подписок"""
-        while True:
-            try:
-                # Получаем всех пользователей с активными подписками
-                users = await self.db.get_all_users()
-                now = datetime.datetime.now()
-                
-                for user in users:
-                    if user.get("subscription_end"):
-                        end_time = datetime.datetime.strptime(
-                            user["subscription_end"],
-                            "%d.%m.%Y %H:%M:%S"
-                        )
-                        
-                        # Если до окончания подписки остался час
-                        if (end_time - now).total_seconds() <= 3600:
-                            await self.bot.send_message(
-                                chat_id=user["user_id"],
-                                text="⚠️ Внимание! Ваша подписка истекает через час.\n"
-                                     "Чтобы продлить подписку, нажмите кнопку ниже:",
-                                reply_markup=get_subscription_keyboard()
-                            )
-                
-                # Проверяем каждые 5 минут
-                await asyncio.sleep(300)
-                
-            except Exception as e:
-                logging.error(f"Ошибка при проверке окончания подписок: {e}")
-                await asyncio.sleep(60)  # При ошибке ждем минуту перед следующей попыткой
+        """Фоновая задача для проверки окончания подписок (одна итерация)"""
+        # Пользователи, у которых до окончания подписки остался час
+        users = await self.db.get_expiring_users(
+            datetime.datetime.now() + datetime.timedelta(hours=1)
+        )
+        
+        for user in users:
+            await self.bot.send_message(
+                chat_id=user["user_id"],
+                text="⚠️ Внимание! Ваша подписка истекает через час.\n"
+                     "Чтобы продлить подписку, нажмите кнопку ниже:",
+                reply_markup=self.plans.subscription_keyboard
+            )
 
     async def process_subscription_choice(self, callback_query: types.CallbackQuery, test_mode: bool = False):
         """Обработчик выбора подписки"""
         try:
             # Получаем информацию о выбранной подписке
             subscription_type = callback_query.data
-            selected_sub = SUBSCRIPTION_PRICES.get(subscription_type)
+            selected_sub = self.plans.get(subscription_type)
             
             if not selected_sub:
                 await callback_query.answer("❌ Неверный тип подписки", show_alert=True)
@@ -156,7 +127,7 @@ class PaymentHandler:
             if user and user.get("subscription_end"):
                 end_time = datetime.datetime.strptime(
                     user["subscription_end"],
-                    "%d.%m.%Y %H:%M:%S"
+                    DATETIME_FORMAT
                 )
                 if end_time > datetime.datetime.now():
                     # Если подписка активна, предлагаем продлить
@@ -224,14 +195,19 @@ class PaymentHandler:
                 )
                 return
             
-            # Реальный режим - создаем форму для оплаты через ЮMoney
-            quickpay = Quickpay(
-                receiver=self.wallet_number,
-                quickpay_form="shop",
+            # Реальный режим - выставляем счет и собираем ссылку на форму оплаты ЮMoney
+            label = _new_label(callback_query.from_user.id, subscription_type)
+            await self.db.create_invoice(
+                label=label,
+                user_id=callback_query.from_user.id,
+                chat_id=callback_query.message.chat.id,
+                plan_id=subscription_type,
+                amount=selected_sub['amount']
+            )
+            payment_url = self.payment_links.build(
                 targets=f"Оплата {selected_sub['name']}",
-                paymentType="AC",
-                sum=selected_sub['amount'],
-                label=f"{callback_query.from_user.id}_{callback_query.data}"
+                amount=selected_sub['amount'],
+                label=label
             )
             
             # Отправляем сообщение с информацией об оплате
@@ -240,12 +216,12 @@ class PaymentHandler:
                 "нажмите кнопку 'Оплатить' ниже.\n\n"
                 "⏳ После оплаты бот автоматически проверит статус платежа.\n"
                 "Время ожидания: 10 минут",
-                reply_markup=get_payment_keyboard(quickpay.redirected_url)
+                reply_markup=get_payment_keyboard(payment_url)
             )
             
             # Запускаем автоматическую проверку оплаты
-            asyncio.create_task(self.check_payment(
-                label=f"{callback_query.from_user.id}_{callback_query.data}",
+            await self.tasks.spawn(f"check_payment:{label}", self.check_payment(
+                label=label,
                 chat_id=callback_query.message.chat.id
             ))
             
@@ -257,20 +233,26 @@ class PaymentHandler:
         """Обработчик продления подписки"""
         try:
             subscription_type = callback_query.data.replace("extend_", "")
-            selected_sub = SUBSCRIPTION_PRICES.get(subscription_type)
+            selected_sub = self.plans.get(subscription_type)
             
             if not selected_sub:
                 await callback_query.answer("❌ Неверный тип подписки", show_alert=True)
                 return
 
-            # Создаем форму для оплаты через ЮMoney
-            quickpay = Quickpay(
-                receiver=self.wallet_number,
-                quickpay_form="shop",
+            # Выставляем счет и собираем ссылку на форму оплаты ЮMoney
+            label = _new_label(callback_query.from_user.id, subscription_type, is_extension=True)
+            await self.db.create_invoice(
+                label=label,
+                user_id=callback_query.from_user.id,
+                chat_id=callback_query.message.chat.id,
+                plan_id=subscription_type,
+                amount=selected_sub['amount'],
+                is_extension=True
+            )
+            payment_url = self.payment_links.build(
                 targets=f"Продление {selected_sub['name']}",
-                paymentType="AC",
-                sum=selected_sub['amount'],
-                label=f"{callback_query.from_user.id}_extend_{subscription_type}"
+                amount=selected_sub['amount'],
+                label=label
             )
             
             # Отправляем сообщение с информацией об оплате
@@ -279,14 +261,13 @@ class PaymentHandler:
                 "нажмите кнопку 'Оплатить' ниже.\n\n"
                 "⏳ После оплаты бот автоматически проверит статус платежа.\n"
                 "Время ожидания: 10 минут",
-                reply_markup=get_payment_keyboard(quickpay.redirected_url)
+                reply_markup=get_payment_keyboard(payment_url)
             )
             
             # Запускаем автоматическую проверку оплаты
-            asyncio.create_task(self.check_payment(
-                label=f"{callback_query.from_user.id}_extend_{subscription_type}",
-                chat_id=callback_query.message.chat.id,
-                is_extension=True
+            await self.tasks.spawn(f"check_payment:{label}", self.check_payment(
+                label=label,
+                chat_id=callback_query.message.chat.id
             ))
 
         except Exception as e:
@@ -297,66 +278,88 @@ class PaymentHandler:
         """Обработчик отмены продления подписки"""
         await callback_query.message.edit_text("❌ Продление подписки отменено.")
 
-    async def check_payment(self, label: str, chat_id: int, is_extension: bool = False) -> bool:
-        """Функция для проверки статуса платежа"""
+    @traced("payment.credit_invoice")
+    async def credit_invoice(self, invoice: Dict) -> bool:
+        """
+        Зачисляет оплату счета: выдает или продлевает подписку. Платеж
+        засчитывается один раз и только если сумма не меньше цены счета
+
+        Args:
+            invoice (Dict): Счет (см. Database.create_invoice)
+
+        Returns:
+            bool: True, если подписка выдана
+        """
+        label = invoice["label"]
+        if not await self.ledger.claim(label, invoice["amount"]):
+            logging.warning(f"Платеж {label} не зачислен")
+            await self.bot.send_message(
+                chat_id=invoice["chat_id"],
+                text="❌ Не удалось зачислить оплату: сумма платежа меньше цены тарифа "
+                     "или платеж уже зачислен. Пожалуйста, обратитесь в поддержку."
+            )
+            return False
+
+        # Получаем информацию о пользователе
+        user_id = invoice["user_id"]
+        user = await self.db.get_user(user_id)
+        username = user["username"] if user else "Unknown"
+
+        if invoice["is_extension"]:
+            # Если это продление, атомарно сдвигаем дату окончания подписки
+            sub_info = self.plans.plans[invoice["plan_id"]]
+            new_end = await self.db.extend_subscription(
+                user_id=user_id,
+                username=username,
+                label=sub_info["label"],
+                duration=sub_info["duration"]
+            )
+
+            await self.bot.send_message(
+                chat_id=invoice["chat_id"],
+                text=f"✅ Подписка успешно продлена!\n"
+                     f"Новая дата окончания: {new_end.strftime('%d.%m.%Y %H:%M')}"
+            )
+        else:
+            # Присваиваем label пользователю
+            await self.assign_user_label(user_id, username, invoice["plan_id"])
+        return True
+
+    @traced("payment.check_payment")
+    async def check_payment(self, label: str, chat_id: int) -> bool:
+        """
+        Функция для проверки статуса платежа
+
+        Args:
+            label (str): Метка счета (см. _new_label)
+            chat_id (int): Чат для уведомлений
+        """
         try:
-            # Максимальное время ожидания - 10 минут
-            max_attempts = 30  # 30 попыток по 20 секунд
+            # Максимальное время ожидания - PAYMENT_CHECK_TIMEOUT
+            max_attempts = int(PAYMENT_CHECK_TIMEOUT.total_seconds() // PAYMENT_CHECK_INTERVAL)
             attempts = 0
             
             while attempts < max_attempts:
-                # Получаем историю операций за последние 10 минут
-                history = self.yoomoney_client.operation_history(
-                    label=label,
-                    from_date=datetime.datetime.now() - datetime.timedelta(minutes=10)
-                )
+                # Проверяем локальный журнал платежей, его наполняет фоновая синхронизация
+                if self.ledger.is_paid(label):
+                    invoice = await self.db.get_invoice(label)
+                    if not invoice:
+                        logging.error(f"Счет {label} не найден")
+                        return False
+                    return await self.credit_invoice(invoice)
                 
-                # Проверяем каждую операцию
-                for operation in history.operations:
-                    if operation.status == "success" and operation.label == label:
-                        # Получаем user_id и тип подписки из label
-                        label_parts = label.split("_")
-                        if len(label_parts) >= 2:
-                            user_id = int(label_parts[0])
-                            subscription_type = "_".join(label_parts[1:])  # Объединяем оставшиеся части
-                            
-                            # Получаем информацию о пользователе
-                            user = await self.db.get_user(user_id)
-                            username = user["username"] if user else "Unknown"
-                            
-                            if is_extension:
-                                # Если это продление, обновляем дату окончания подписки
-                                current_end = datetime.datetime.strptime(
-                                    user["subscription_end"],
-                                    "%d.%m.%Y %H:%M:%S"
-                                )
-                                new_end = current_end + SUBSCRIPTION_PRICES[subscription_type]["duration"]
-                                
-                                await self.db.update_user_subscription(
-                                    user_id=user_id,
-                                    subscription_end=new_end
-                                )
-                                
-                                await self.bot.send_message(
-                                    chat_id=chat_id,
-                                    text=f"✅ Подписка успешно продлена!\n"
-                                         f"Новая дата окончания: {new_end.strftime('%d.%m.%Y %H:%M')}"
-                                )
-                            else:
-                                # Присваиваем label пользователю
-                                await self.assign_user_label(user_id, username, subscription_type)
-                            return True
                 
                 # Увеличиваем счетчик попыток
                 attempts += 1
                 
-                # Ждем 20 секунд перед следующей проверкой
-                await asyncio.sleep(20)
+                # Ждем перед следующей проверкой
+                await asyncio.sleep(PAYMENT_CHECK_INTERVAL)
                 
-            # Если оплата не поступила за 10 минут
+            # Если оплата не поступила за время ожидания, ее зачислит сверка (reconcile_payments)
             await self.bot.send_message(
                 chat_id=chat_id,
-                text="❌ Время ожидания оплаты истекло. Пожалуйста, попробуйте оплатить снова."
+                text="⌛ Оплата пока не поступила. Если вы уже оплатили, подписка будет "
+                     "выдана автоматически, как только платеж дойдет."
             )
             return False
             
@@ -368,29 +371,45 @@ class PaymentHandler:
             )
             return False
 
+    @traced("payment.reconcile_payments")
+    async def reconcile_payments(self) -> int:
+        """
+        Сверка с журналом платежей: зачисляет оплаты счетов, чья проверка
+        (check_payment) уже закончилась или потерялась при перезапуске, и
+        отклоняет оплаты с меткой, для которой нет счета
+
+        Returns:
+            int: Сколько счетов зачислено
+        """
+        invoices = await self.db.get_unclaimed_invoices(
+            created_before=datetime.datetime.now() - PAYMENT_CHECK_TIMEOUT
+        )
+        credited = 0
+        for invoice in invoices:
+            logging.info(f"Сверка: зачисляем оплату счета {invoice['label']}")
+            if await self.credit_invoice(invoice):
+                credited += 1
+
+        for label in await self.ledger.reject_without_invoice():
+            logging.warning(f"Сверка: платеж {label} без счета отклонен")
+        return credited
+
     async def process_check_payment(self, callback_query: types.CallbackQuery):
         """Обработчик кнопки 'Я оплатил'"""
         try:
             # Получаем label из callback_data
             label = callback_query.data.replace("check_payment_", "")
             
-            # Проверяем статус платежа
-            history = self.yoomoney_client.operation_history(
-                label=label,
-                from_date=datetime.datetime.now() - datetime.timedelta(minutes=30)
-            )
-            
-            # Проверяем каждую операцию
-            for operation in history.operations:
-                if operation.status == "success" and operation.label == label:
-                    # Если найдена успешная операция, отправляем сообщение
-                    await callback_query.message.edit_text(
-                        "✅ Оплата успешно получена! Ваша подписка активирована.",
-                        reply_markup=None
-                    )
-                    return
+            # Проверяем статус платежа по локальному журналу
+            if self.ledger.is_paid(label):
+                await callback_query.message.edit_text(
+                    "✅ Оплата успешно получена! Ваша подписка активирована.",
+                    reply_markup=None
+                )
+                return
             
-            # Если оплата не найдена
+            # Если оплата не найдена, просим внеочередную синхронизацию журнала
+            self.ledger.request_sync()
             await callback_query.answer(
                 "❌ Оплата пока не поступила. Если вы уже оплатили, подождите немного и попробуйте снова.",
                 show_alert=True
@@ -407,7 +426,7 @@ class PaymentHandler:
         """Регистрация обработчиков"""
         dp.register_callback_query_handler(
             self.process_subscription_choice,
-            lambda c: c.data in SUBSCRIPTION_PRICES.keys()
+            lambda c: c.data in self.plans.plans
         )
         dp.register_callback_query_handler(
             self.process_extend_subscription,
@@ -0,0 +1,55 @@
+import functools
+import urllib.parse
+from typing import Optional
+
+# Адрес формы QuickPay; yoomoney.Quickpay собирает ссылку на него же
+QUICKPAY_URL = "https://yoomoney.ru/quickpay/confirm.xml"
+
+
+@functools.lru_cache(maxsize=64)
+def _template(receiver: str, quickpay_form: str, targets: str, payment_type: str, amount: float) -> str:
+    """
+    Закодированная часть ссылки, общая для всех покупателей тарифа.
+    Порядок и кодирование параметров те же, что у yoomoney.Quickpay
+    """
+    return QUICKPAY_URL + "?" + urllib.parse.urlencode({
+        "receiver": receiver,
+        "quickpay-form": quickpay_form,
+        "targets": targets,
+        "paymentType": payment_type,
+        "sum": amount
+    })
+
+
+class PaymentLinkBuilder:
+    def __init__(self, receiver: str, quickpay_form: str = "shop", payment_type: str = "AC"):
+        """
+        Собирает ссылку на форму оплаты ЮMoney локально, без запроса к ЮMoney.
+        yoomoney.Quickpay ради той же ссылки делает синхронный HTTP-запрос
+        и блокирует event loop на время ответа
+
+        Args:
+            receiver (str): Кошелек-получатель ЮMoney
+            quickpay_form (str): Тип формы
+            payment_type (str): Способ оплаты (AC — банковская карта)
+        """
+        self.receiver = receiver
+        self.quickpay_form = quickpay_form
+        self.payment_type = payment_type
+
+    def build(self, targets: str, amount: float, label: Optional[str] = None) -> str:
+        """
+        Возвращает ссылку на форму оплаты
+
+        Args:
+            targets (str): Назначение платежа
+            amount (float): Сумма, ₽
+            label (str): Метка платежа, по которой журнал находит оплату
+
+        Returns:
+            str: Ссылка, совпадающая с Quickpay(...).base_url для тех же параметров
+        """
+        url = _template(self.receiver, self.quickpay_form, targets, self.payment_type, amount)
+        if label is None:
+            return url
+        return url + "&" + urllib.parse.urlencode({"label": label})
@@ -0,0 +1,112 @@
+import datetime
+import logging
+import types
+from typing import Dict, List, Mapping, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from database import Database
+from keyboards import get_subscription_keyboard
+
+# Тарифы, которыми заполняется пустая таблица plans
+DEFAULT_PLANS = [
+    {
+        "plan_id": "sub_basic",
+        "amount": 90,
+        "name": "Подписка на день",
+        "title": "День",
+        "label": "basic_user",
+        "duration": datetime.timedelta(days=1)
+    },
+    {
+        "plan_id": "sub_standard",
+        "amount": 440,
+        "name": "Подписка на неделю",
+        "title": "Неделя",
+        "label": "standard_user",
+        "duration": datetime.timedelta(days=7)
+    },
+    {
+        "plan_id": "sub_premium",
+        "amount": 1620,
+        "name": "Подписка на месяц",
+        "title": "Месяц",
+        "label": "premium_user",
+        "duration": datetime.timedelta(days=30)
+    }
+]
+
+
+class PlanCatalog:
+    def __init__(self, db: Database):
+        """
+        Каталог тарифов, загружаемый из таблицы plans
+
+        Тарифы и построенные по ним клавиатура и описание хранятся одним
+        неизменяемым снимком, который целиком подменяется при изменении тарифа, так что
+        обработчики никогда не видят наполовину обновленный каталог.
+
+        Args:
+            db (Database): База данных
+        """
+        self.db = db
+        self._snapshot = (types.MappingProxyType({}), get_subscription_keyboard([]), "")
+
+    async def load(self) -> None:
+        """Загружает тарифы из базы, при первом запуске заполняя ее тарифами по умолчанию"""
+        plans = await self.db.get_plans()
+        if not plans:
+            for position, plan in enumerate(DEFAULT_PLANS):
+                await self.db.save_plan(plan, position)
+            plans = await self.db.get_plans()
+        self._swap(plans)
+        logging.info(f"Загружено тарифов: {len(plans)}")
+
+    def _swap(self, plans: List[Dict]) -> None:
+        """Строит новый снимок каталога, клавиатуры и описания и подменяет текущий"""
+        catalog = types.MappingProxyType({
+            plan["plan_id"]: types.MappingProxyType(plan) for plan in plans
+        })
+        description = "\n".join(
+            f"🔹 {plan['title']} - {plan['name']}, {plan['duration'].days} дн."
+            for plan in catalog.values()
+        )
+        self._snapshot = (catalog, get_subscription_keyboard(list(catalog.values())), description)
+
+    @property
+    def plans(self) -> Mapping[str, Mapping]:
+        """Тарифы по plan_id: amount, name, title, label, duration"""
+        return self._snapshot[0]
+
+    @property
+    def subscription_keyboard(self) -> InlineKeyboardMarkup:
+        """Клавиатура выбора тарифа для текущего снимка"""
+        return self._snapshot[1]
+
+    @property
+    def description(self) -> str:
+        """Описание тарифов для сообщения с клавиатурой выбора"""
+        return self._snapshot[2]
+
+    def get(self, plan_id: str) -> Optional[Mapping]:
+        """Возвращает тариф по plan_id"""
+        return self.plans.get(plan_id)
+
+    async def update_plan(self, plan_id: str, amount: int, duration: datetime.timedelta,
+                          name: Optional[str] = None, title: Optional[str] = None,
+                          label: Optional[str] = None) -> None:
+        """
+        Изменяет тариф и перестраивает снимок каталога
+
+        Args:
+            plan_id (str): ID тарифа
+            amount (int): Новая цена, ₽
+            duration (timedelta): Новый срок подписки
+            name (str): Новое название, если нужно сменить
+            title (str): Новый текст кнопки, если нужно сменить
+            label (str): Новый статус пользователя, если нужно сменить; уже
+                выданные подписки сохраняют прежний
+        """
+        await self.db.update_plan(plan_id, amount, duration, name, title, label)
+        self._swap(await self.db.get_plans())
+        logging.info(f"Тариф {plan_id} изменен: {amount}₽, {duration}")
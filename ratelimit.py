@@ -0,0 +1,43 @@
+import asyncio
+import time
+from typing import Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+
+
+class RateLimiter(BaseRequestMiddleware):
+    def __init__(self, rate: float = 30.0, burst: Optional[float] = None):
+        """
+        Общий лимит исходящих запросов к Telegram (token bucket)
+
+        Подключается к сессии, которую делят все боты процесса, поэтому лимит
+        общий для всех арендаторов. Long polling (getUpdates) не ограничивается.
+
+        Args:
+            rate (float): Запросов в секунду
+            burst (float): Емкость корзины, по умолчанию равна rate
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Ждет, пока в корзине появится токен, и забирает его"""
+        # Lock выстраивает ожидающих в очередь, чтобы токены раздавались по порядку
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, GetUpdates):
+            await self.acquire()
+        return await make_request(bot, method)
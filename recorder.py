@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import logging
+import secrets
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+
+# Поля пользователя/чата, по которым его можно узнать; first_name обязателен
+# для модели User, поэтому заменяется заглушкой, остальные удаляются
+_PERSONAL_FIELDS = ("last_name", "username", "title", "bio", "description", "phone_number")
+# Вложения с личными данными удаляются целиком
+_PERSONAL_OBJECTS = ("contact", "location", "venue")
+# Свободный текст; команды (/start, /profile 30) сохраняются как есть
+_TEXT_FIELDS = ("text", "caption", "query")
+
+
+def _anonymize_id(value: int, salt: str) -> int:
+    """Заменяет id стабильным для одной записи псевдонимом того же знака"""
+    digest = hashlib.sha256(f"{salt}:{value}".encode()).hexdigest()
+    alias = int(digest[:12], 16) % 2 ** 31 + 1
+    return -alias if value < 0 else alias
+
+
+def anonymize(value: Any, salt: str) -> Any:
+    """
+    Обезличивает апдейт в виде JSON: id пользователей и чатов заменяются
+    псевдонимами, имена и контакты удаляются, текст (кроме команд) заменяется
+    символами «x» той же длины, чтобы не сдвигать entities
+
+    Args:
+        value (Any): Апдейт (или его часть) после model_dump(mode="json")
+        salt (str): Соль псевдонимов
+    """
+    if isinstance(value, list):
+        return [anonymize(item, salt) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    # Пользователь (есть is_bot) или чат (есть type и числовой id)
+    is_party = "is_bot" in value or ("type" in value and isinstance(value.get("id"), int))
+    result = {}
+    for key, item in value.items():
+        if is_party and key == "id":
+            result[key] = _anonymize_id(item, salt)
+        elif is_party and key == "first_name":
+            result[key] = "user"
+        elif (is_party and key in _PERSONAL_FIELDS) or key in _PERSONAL_OBJECTS:
+            continue
+        elif key in _TEXT_FIELDS and isinstance(item, str) and not item.startswith("/"):
+            result[key] = "x" * len(item)
+        else:
+            result[key] = anonymize(item, salt)
+    return result
+
+
+class UpdateRecorder(BaseMiddleware):
+    def __init__(self, path: str, salt: Optional[str] = None, flush_size: int = 100,
+                 flush_interval: float = 5.0):
+        """
+        Outer-middleware апдейтов: пишет входящие апдейты в обезличенном виде
+        в сжатый JSONL для последующего воспроизведения (replay.py)
+
+        Каждая строка — {"ts": время получения, "tenant": ключ арендатора,
+        "admin": апдейт от администратора, "update": апдейт}. Записи копятся
+        в буфере и дописываются в файл отдельными gzip-блоками.
+
+        Args:
+            path (str): Файл записи (.jsonl.gz)
+            salt (str): Соль псевдонимов id; по умолчанию случайная на каждый
+                запуск, чтобы псевдонимы нельзя было перебором сопоставить с id
+            flush_size (int): Сколько апдейтов копить перед записью в файл
+            flush_interval (float): Максимальный интервал между записями, сек
+        """
+        self.path = path
+        self.salt = salt or secrets.token_hex(16)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+
+    async def __call__(self, handler, event, data):
+        self.record(event, data)
+        return await handler(event, data)
+
+    def record(self, event, data: Dict) -> None:
+        """Обезличивает апдейт и кладет его в буфер"""
+        try:
+            config = data.get("config")
+            user = data.get("event_from_user")
+            update = event.model_dump(mode="json", exclude_none=True, by_alias=True)
+            entry = {
+                "ts": time.time(),
+                "tenant": config.key if config else None,
+                "admin": bool(config and user and config.is_admin(user.id)),
+                "update": anonymize(update, self.salt)
+            }
+            self._buffer.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            # Запись трафика не должна мешать обработке апдейта
+            logging.error(f"Ошибка при записи апдейта: {e}")
+            return
+
+        if (len(self._buffer) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Дописывает накопленные апдейты в файл"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError as e:
+            logging.error(f"Ошибка при записи апдейтов в {self.path}: {e}")
+
+
+def read_recording(path: str) -> List[Dict]:
+    """
+    Читает запись апдейтов в порядке получения
+
+    Args:
+        path (str): Файл записи (.jsonl.gz)
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
@@ -0,0 +1,270 @@
+"""
+Воспроизведение записанного трафика (RECORD_FILE) для сравнения версий бота
+
+Собирает приложение через create_app с временной базой, заглушками Telegram
+и ЮMoney, подает записанные апдейты в диспетчер с исходными интервалами
+(ускоренными в --speed раз) и печатает задержку и пропускную способность
+по обработчикам.
+
+    python replay.py updates.jsonl.gz --speed 10 --json report.json
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+import typing
+from typing import Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Chat, Message, Update, User
+
+from app import create_app
+from config import Config, TenantConfig
+from ratelimit import RateLimiter
+from recorder import read_recording
+
+
+class _StubSession(BaseSession):
+    """Сессия бота без сети: отвечает на запросы правдоподобными объектами"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = method.__returning__
+        candidates = typing.get_args(returning) or (returning,)
+        if Message in candidates:
+            chat_id = getattr(method, "chat_id", None)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+                text=getattr(method, "text", None)
+            ).as_(bot)
+        if User in candidates:
+            return User(id=bot.id, is_bot=True, first_name="replay").as_(bot)
+        if bool in candidates:
+            return True
+        return None
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class _StubYooMoney:
+    """
+    Заглушка клиента ЮMoney. Как и настоящий клиент, синхронная: latency
+    имитирует время ответа и блокирует вызывающий поток
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def account_info(self):
+        time.sleep(self.latency)
+        return types.SimpleNamespace(account="0", balance=0, currency="643")
+
+    def operation_history(self, **kwargs):
+        time.sleep(self.latency)
+        return types.SimpleNamespace(operations=[], next_record=None)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner-middleware: замеряет время каждого обработчика"""
+
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__qualname__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        finally:
+            self.timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(entries: List[Dict], db_path: str, speed: float, concurrency: int,
+                 api_latency: float, yoomoney_latency: float, rate_limit: float) -> Dict:
+    """
+    Подает записанные апдейты в диспетчер и собирает статистику
+
+    Args:
+        entries (List[Dict]): Записи из read_recording
+        db_path (str): Временная база
+        speed (float): Во сколько раз ускорить поток; 0 — без пауз
+        concurrency (int): Максимум одновременно обрабатываемых апдейтов
+        api_latency (float): Задержка ответа заглушки Telegram, сек
+        yoomoney_latency (float): Задержка ответа заглушки ЮMoney, сек
+        rate_limit (float): Лимит запросов к Telegram в секунду; 0 — без лимита
+
+    Returns:
+        Dict: Отчет: общие показатели и статистика по обработчикам
+    """
+    # Арендаторы и администраторы восстанавливаются по записи
+    admins: Dict[str, set] = {}
+    for entry in entries:
+        tenant_admins = admins.setdefault(entry["tenant"] or "default", set())
+        if entry["admin"]:
+            update = Update.model_validate(entry["update"])
+            user = getattr(update.event, "from_user", None)
+            if user:
+                tenant_admins.add(user.id)
+    config = Config(
+        tenants=[
+            TenantConfig(key, f"{100000 + i}:REPLAY", "replay", "0", sorted(ids))
+            for i, (key, ids) in enumerate(admins.items())
+        ],
+        db_path=db_path
+    )
+
+    app = create_app(config)
+    for tenant in app.tenants:
+        session = _StubSession(api_latency)
+        if rate_limit:
+            session.middleware(RateLimiter(rate_limit))
+        tenant.bot = Bot(token=tenant.config.bot_token, session=session)
+        tenant.yoomoney_client = _StubYooMoney(yoomoney_latency)
+    bots = {tenant.key: tenant.bot for tenant in app.tenants}
+
+    timing = HandlerTimingMiddleware()
+    for name, observer in app.dispatcher.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(timing)
+
+    app.loop_monitor.start()
+    await app.startup()
+
+    unhandled = 0
+    failed = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def feed(entry: Dict) -> None:
+        nonlocal unhandled, failed
+        try:
+            update = Update.model_validate(entry["update"])
+            result = await app.dispatcher.feed_update(bots[entry["tenant"] or "default"], update)
+            if result is UNHANDLED:
+                unhandled += 1
+        except Exception as e:
+            failed += 1
+            logging.debug(f"Ошибка при обработке апдейта: {e}")
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    first_ts = entries[0]["ts"]
+    pending = []
+    for entry in entries:
+        if speed:
+            delay = (entry["ts"] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await slots.acquire()
+        pending.append(asyncio.create_task(feed(entry)))
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+
+    await app.shutdown()
+
+    handlers = {
+        name: {
+            "count": len(values),
+            "errors": timing.errors.get(name, 0),
+            "p50_ms": _percentile(values, 0.5),
+            "p95_ms": _percentile(values, 0.95),
+            "p99_ms": _percentile(values, 0.99),
+            "max_ms": max(values)
+        }
+        for name, values in timing.timings.items()
+    }
+    return {
+        "updates": len(entries),
+        "unhandled": unhandled,
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "throughput": len(entries) / elapsed if elapsed else 0.0,
+        "max_loop_lag_s": app.loop_monitor.max_lag,
+        "handlers": handlers
+    }
+
+
+def print_report(report: Dict) -> None:
+    """Печатает отчет таблицей"""
+    print(f"Апдейтов: {report['updates']} (без обработчика: {report['unhandled']}, "
+          f"с ошибкой: {report['failed']})")
+    print(f"Время: {report['elapsed_s']:.2f} с, {report['throughput']:.1f} апдейтов/с, "
+          f"макс. задержка event loop: {report['max_loop_lag_s'] * 1000:.0f} мс")
+    print()
+    print(f"{'Обработчик':<55} {'кол-во':>7} {'ошибки':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    handlers = sorted(report["handlers"].items(), key=lambda item: -item[1]["count"])
+    for name, stats in handlers:
+        print(f"{name:<55} {stats['count']:>7} {stats['errors']:>7} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+              f"{stats['max_ms']:>8.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    parser.add_argument("recording", help="Файл записи (RECORD_FILE)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ускорение относительно записи; 0 — подавать без пауз")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Максимум одновременно обрабатываемых апдейтов")
+    parser.add_argument("--api-latency", type=float, default=0.05,
+                        help="Задержка ответа Telegram API, сек")
+    parser.add_argument("--yoomoney-latency", type=float, default=0.2,
+                        help="Задержка ответа ЮMoney, сек")
+    parser.add_argument("--rate-limit", type=float, default=30.0,
+                        help="Лимит запросов к Telegram в секунду; 0 — без лимита")
+    parser.add_argument("--limit", type=int, help="Воспроизвести только первые N апдейтов")
+    parser.add_argument("--json", help="Сохранить отчет в JSON для сравнения версий")
+    args = parser.parse_args(argv)
+
+    entries = read_recording(args.recording)[:args.limit]
+    if not entries:
+        print("Запись пуста")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = asyncio.run(replay(
+            entries, os.path.join(tmp, "replay.db"), args.speed, args.concurrency,
+            args.api_latency, args.yoomoney_latency, args.rate_limit
+        ))
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
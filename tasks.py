@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Coroutine, Dict, Optional, Tuple
+
+from tracing import tracer
+
+
+class TaskSupervisor:
+    def __init__(self, max_concurrent: int = 100, max_backoff: float = 300.0):
+        """
+        Супервизор фоновых задач
+
+        Все задачи именуются и отслеживаются. Разовые задачи (spawn) ограничены
+        max_concurrent: при исчерпании лимита вызывающий ждет свободного места.
+        Периодические задачи (periodic) перезапускаются после падения с
+        экспоненциальной задержкой.
+
+        Args:
+            max_concurrent (int): Лимит одновременно выполняемых разовых задач
+            max_backoff (float): Максимальная задержка перед перезапуском, сек
+        """
+        self.max_concurrent = max_concurrent
+        self.max_backoff = max_backoff
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks: Dict[asyncio.Task, Tuple[float, bool]] = {}
+        self._waiting = 0
+        self._closed = False
+
+    async def spawn(self, name: str, coro: Coroutine) -> asyncio.Task:
+        """
+        Запускает разовую задачу, дождавшись свободного места под лимитом
+
+        Args:
+            name (str): Имя задачи
+            coro (Coroutine): Корутина задачи
+
+        Returns:
+            asyncio.Task: Запущенная задача
+        """
+        if self._closed:
+            coro.close()
+            raise RuntimeError("Супервизор задач остановлен")
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self._waiting -= 1
+
+        # Пока ждали места, супервизор могли остановить
+        if self._closed:
+            self._slots.release()
+            coro.close()
+            raise RuntimeError("Супервизор задач остановлен")
+
+        task = asyncio.create_task(coro, name=name)
+        self._track(task, on_done=self._slots.release)
+        return task
+
+    def periodic(self, name: str, func: Callable[[], Awaitable], interval: float,
+                 wakeup: Optional[asyncio.Event] = None) -> asyncio.Task:
+        """
+        Запускает периодическую задачу вне лимита разовых задач
+
+        Args:
+            name (str): Имя задачи
+            func (Callable): Корутинная функция одной итерации
+            interval (float): Пауза между итерациями, сек
+            wakeup (asyncio.Event): Событие, досрочно запускающее следующую итерацию
+        """
+        task = asyncio.create_task(self._run_periodic(name, func, interval, wakeup), name=name)
+        self._track(task, periodic=True)
+        return task
+
+    async def _run_periodic(self, name: str, func: Callable[[], Awaitable], interval: float,
+                            wakeup: Optional[asyncio.Event]) -> None:
+        """Цикл периодической задачи с перезапуском после ошибок"""
+        failures = 0
+        while True:
+            try:
+                # Каждая итерация — отдельная трасса
+                with tracer.span(f"job.{name}", new_trace=True):
+                    await func()
+                failures = 0
+                delay = interval
+            except Exception as e:
+                failures += 1
+                delay = min(interval * 2 ** (failures - 1), self.max_backoff)
+                logging.error(
+                    f"Фоновая задача {name} упала ({failures} раз подряд), "
+                    f"перезапуск через {delay:.0f} с: {e}"
+                )
+
+            if wakeup is None:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+    def _track(self, task: asyncio.Task, on_done: Optional[Callable[[], None]] = None,
+               periodic: bool = False) -> None:
+        """Сохраняет ссылку на задачу до ее завершения"""
+        self._tasks[task] = (time.monotonic(), periodic)
+
+        def done(task: asyncio.Task) -> None:
+            self._tasks.pop(task, None)
+            if on_done:
+                on_done()
+            if not task.cancelled() and task.exception():
+                logging.error(f"Фоновая задача {task.get_name()} завершилась с ошибкой: {task.exception()}")
+
+        task.add_done_callback(done)
+
+    def stats(self) -> Dict:
+        """
+        Возвращает состояние задач
+
+        Returns:
+            Dict: running — число задач, waiting — ждущих места под лимитом,
+                by_name — число задач по префиксу имени (до ':'),
+                oldest_age — возраст самой старой разовой задачи, сек
+        """
+        now = time.monotonic()
+        by_name: Dict[str, int] = {}
+        for task in self._tasks:
+            prefix = task.get_name().split(":", 1)[0]
+            by_name[prefix] = by_name.get(prefix, 0) + 1
+        ages = [now - started for started, periodic in self._tasks.values() if not periodic]
+        return {
+            "running": len(self._tasks),
+            "waiting": self._waiting,
+            "limit": self.max_concurrent,
+            "by_name": by_name,
+            "oldest_age": max(ages, default=0.0)
+        }
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        Отменяет все задачи и ждет их завершения не дольше timeout
+
+        Args:
+            timeout (float): Крайний срок ожидания, сек
+        """
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            logging.warning(f"Фоновая задача {task.get_name()} не завершилась за {timeout} с")
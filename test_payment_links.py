@@ -0,0 +1,50 @@
+import types
+
+import httpx
+import pytest
+from yoomoney import Quickpay
+
+from payment_links import PaymentLinkBuilder
+
+RECEIVER = "4100118000000000"
+
+
+@pytest.fixture
+def quickpay_url(monkeypatch):
+    """Ссылка, которую собирает yoomoney.Quickpay; запрос к ЮMoney подменен заглушкой"""
+    def post(url, **kwargs):
+        return types.SimpleNamespace(url=url)
+
+    monkeypatch.setattr(httpx, "post", post)
+
+    def build(targets, amount, label=None):
+        quickpay = Quickpay(
+            receiver=RECEIVER,
+            quickpay_form="shop",
+            targets=targets,
+            paymentType="AC",
+            sum=amount,
+            label=label
+        )
+        return quickpay.base_url
+
+    return build
+
+
+@pytest.mark.parametrize("targets", [
+    "Оплата Подписка на день",
+    "Продление Подписка на месяц",
+    "Оплата & возврат = 100% + бонус?",
+    "a/b#c;d,e:f@g$h'i(j)k*l!m~n"
+])
+@pytest.mark.parametrize("amount", [90, 440.0, 1620.5, 99.99, 0.1])
+@pytest.mark.parametrize("label", [None, "123_sub_basic_0a1b2c3d", "123_extend_sub_premium_ffff0000"])
+def test_build_matches_quickpay(quickpay_url, targets, amount, label):
+    builder = PaymentLinkBuilder(RECEIVER)
+    assert builder.build(targets, amount, label) == quickpay_url(targets, amount, label)
+
+
+def test_build_reserved_characters_in_label(quickpay_url):
+    builder = PaymentLinkBuilder(RECEIVER)
+    label = "user 1&sum=0#x"
+    assert builder.build("Оплата", 90, label) == quickpay_url("Оплата", 90, label)
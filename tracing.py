@@ -0,0 +1,252 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# Текущий span. asyncio.create_task копирует контекст, поэтому фоновые
+# задачи (например, check_payment) продолжают трассу породившего их апдейта.
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """Один замер: имя, родитель, время начала/окончания и атрибуты"""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name",
+        "start_ns", "end_ns", "attributes", "error"
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Добавляет атрибут к span"""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        """Длительность span в миллисекундах"""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Представление span в формате OTLP/JSON"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Преобразует атрибут в формат OTLP/JSON (AnyValue)"""
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, service_name: str = "sanyabot",
+                 flush_size: int = 100, flush_interval: float = 5.0):
+        """
+        Трассировщик апдейтов
+
+        Args:
+            path (str): Файл для записи span (OTLP/JSON, по строке на пакет).
+                Если не указан, span не сохраняются, но trace id назначается
+            service_name (str): Значение service.name в ресурсе OTLP
+            flush_size (int): Сколько span копить перед записью в файл
+            flush_interval (float): Максимальный интервал между записями, сек
+
+        Файл пишет отдельный поток: сериализация и запись пакета не
+        занимают event loop.
+        """
+        self.path = path
+        self.service_name = service_name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Span] = []
+        self._last_flush = time.monotonic()
+        # Пакеты (файл, span) для потока записи; None останавливает поток
+        self._queue: "queue.SimpleQueue[Optional[Tuple[str, List[Span]]]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextlib.contextmanager
+    def span(self, name: str, new_trace: bool = False, **attributes):
+        """
+        Открывает span как дочерний к текущему
+
+        Args:
+            name (str): Имя span
+            new_trace (bool): Начать новую трассу вместо продолжения текущей
+            **attributes: Атрибуты span
+        """
+        parent = None if new_trace else _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        """Кладет завершенный span в буфер и при необходимости сбрасывает его"""
+        if not self.enabled:
+            return
+        self._buffer.append(span)
+        if (len(self._buffer) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Передает накопленные span потоку записи одним пакетом"""
+        self._last_flush = time.monotonic()
+        if not self._buffer or not self.enabled:
+            return
+        spans, self._buffer = self._buffer, []
+        self._queue.put((self.path, spans))
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+
+    def close(self) -> None:
+        """Сбрасывает буфер и ждет, пока поток записи допишет все пакеты"""
+        self.flush()
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _write_loop(self) -> None:
+        """Поток записи: дописывает пакеты в файл по порядку"""
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            self._write(*batch)
+
+    def _write(self, path: str, spans: List[Span]) -> None:
+        """Записывает span в файл одним пакетом OTLP"""
+        payload = {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [_otlp_attribute("service.name", self.service_name)]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "sanyabot.tracing"},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"Ошибка при записи трассировки в {path}: {e}")
+
+
+# Глобальный трассировщик; включается через configure_tracing
+tracer = Tracer()
+
+
+def configure_tracing(path: Optional[str]) -> Tracer:
+    """Включает запись трассировки в указанный файл"""
+    tracer.flush()
+    tracer.path = path
+    if path:
+        logging.info(f"Трассировка включена, файл: {path}")
+    return tracer
+
+
+def current_trace_id() -> Optional[str]:
+    """Возвращает trace id текущего апдейта"""
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def traced(name: Optional[str] = None, **attributes) -> Callable:
+    """
+    Декоратор для асинхронных функций: оборачивает вызов в span
+
+    Args:
+        name (str): Имя span, по умолчанию — qualname функции
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(span_name, **attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: открывает новую трассу на каждый апдейт"""
+
+    async def __call__(self, handler, event, data):
+        attributes = {"update.id": event.update_id, "update.type": event.event_type}
+        inner = event.event
+        if getattr(inner, "from_user", None):
+            attributes["user.id"] = inner.from_user.id
+        if getattr(inner, "data", None):
+            attributes["callback.data"] = inner.data
+        with tracer.span("update", new_trace=True, **attributes):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: span на каждый запрос к Telegram API"""
+
+    async def __call__(self, make_request, bot, method):
+        with tracer.span(f"telegram.{type(method).__name__}"):
+            return await make_request(bot, method)